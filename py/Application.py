@@ -10,6 +10,8 @@ from PySide6.QtCore import QTimer
 
 from py.Widgets.EditorWindow import EditorWindow
 from py.MessageBroker import MessageBroker, FileAlreadyOpenOnOtherProcessException
+from py.ReparseScheduler import ReparseScheduler
+from py.ParseCache import ParseCache
 from py.Versioning.VersioningSelector import VersioningSelector
 
 from py.Languages.LanguageSelector import LanguageSelector
@@ -65,9 +67,7 @@ class Application(QtWidgets.QApplication, FileAccess):
         self.window = EditorWindow(self.hub)
         self.messageBroker = None
         self._versioningSelector = VersioningSelector(self.hub)
-        
-        self.hub.on(self.hub.get(QtGui.QTextDocument).contentsChange, self._onDocumentContentsChanged)
-        QTimer.singleShot(10, lambda: self._onFileContentChanged(force=True))
+        self.reparseScheduler = ReparseScheduler(self, self.hub)
         
     def _reset(self) -> None:
         self._fileContent = ""
@@ -80,6 +80,8 @@ class Application(QtWidgets.QApplication, FileAccess):
         self.tokens = None
         self.syntaxTree = None
         self.highlighter = None
+        self._pendingAutocomplete = False
+        self._pendingProjectIndex = False
         Log.setPrefix(self.fileNameDescription())
             
     def run(self, argv: list[str]) -> None:
@@ -110,6 +112,7 @@ class Application(QtWidgets.QApplication, FileAccess):
                 
     def closeFile(self) -> None:
         self._reset()
+        self.reparseScheduler.open(None, None, "")
         if self.messageBroker != None:
             self.messageBroker.close()
         self.hub.notify(FileAccess.closeFile)
@@ -129,18 +132,21 @@ class Application(QtWidgets.QApplication, FileAccess):
             self._fileContent = handle.read()
             Log.debug("Read " + str(len(self._fileContent)) + " bytes")
 
-        self.syntaxTree = None
-        self.highlighter = None
-        if self.language != None:
-            assert isinstance(self.language, Language)
-            (self.syntaxTree, self.tokens) = self.language.parse(self._fileContent, None, None)
-            self.highlighter = self.language.syntaxHighlighter(document, self.syntaxTree)
-        
         self.versioning = self._versioningSelector.selectVersioningFor(self._filePath)
         
         self.projectIndex = None
         if self.versioning != None:
             self.projectIndex = ProjectIndex(self.versioning.metaFolder() + "/einsicht.db")
+            if self.language != None and ParseCache.isEnabled():
+                self.language.setParseCache(ParseCache(self.versioning.metaFolder()))
+        
+        self.syntaxTree = None
+        self.highlighter = None
+        # Without the parse worker, the syntax-tree is already there afterwards (see _onParsed)
+        self.reparseScheduler.open(self.language, self._filePath, self._fileContent)
+        if self.language != None:
+            assert isinstance(self.language, Language)
+            self.highlighter = self.language.syntaxHighlighter(document, self.syntaxTree)
         
         self.hashOnDisk = hashlib.md5(self._fileContent.encode()).hexdigest()
         self.lengthOnDisk = len(self._fileContent)
@@ -151,6 +157,7 @@ class Application(QtWidgets.QApplication, FileAccess):
         self.hub.notify(FileAccess.openFile)
         
     def saveFile(self) -> None:
+        self.reparseScheduler.flush()
         try:
             with open(self._filePath, "w") as handle:
                 handle.write(self._fileContent)
@@ -184,6 +191,10 @@ class Application(QtWidgets.QApplication, FileAccess):
         self.saveFile()
             
     def _updateProjectIndex(self) -> None:
+        if not self.reparseScheduler.isCurrent():
+            self._pendingProjectIndex = True # Once the current code is parsed, see _onParsed
+            return
+        self._pendingProjectIndex = False
         if self.syntaxTree != None and self.projectIndex != None:
             context = FileContext(
                 self._filePath, 
@@ -207,31 +218,26 @@ class Application(QtWidgets.QApplication, FileAccess):
     def fileContent(self) -> str:
         return self._fileContent
         
-    def _onDocumentContentsChanged(self, position, removed, added):
-        self._onFileContentChanged()
-        
-    def _onFileContentChanged(self, force: bool = False) -> None:
-        doc = self.hub.get(QtGui.QTextDocument)
-        fileContent = doc.toPlainText()
-        
-        if fileContent == self._fileContent and not force:
-            return
-    
+    @on(ReparseScheduler.changed)
+    def _onFileContentChanged(self, fileContent: str) -> None:
         self._fileContent = fileContent
-        self._reparseFile()
-            
-    def _reparseFile(self) -> None:
-        if self.hub.has(Language):
-            (self.syntaxTree, self.tokens) = self.hub.get(Language).parse(
-                self._fileContent, 
-                self._filePath,
-                self.syntaxTree, 
-                self.tokens
-            )
-            self.hub.register(self.syntaxTree)
+        self.hub.notify(FileAccess.onFileContentChanged)
+        
+    @on(ReparseScheduler.parsed)
+    def _onParsed(self, syntaxTree, tokens) -> None:
+        (self.syntaxTree, self.tokens) = (syntaxTree, tokens)
+        self.hub.register(self.syntaxTree)
+        if self._pendingAutocomplete:
+            self._checkAutocompleteTrigger()
+        if self._pendingProjectIndex:
+            self._updateProjectIndex()
                
     @on(TextField.onStoppedTyping)
     def _checkAutocompleteTrigger(self) -> None:
+        if not self.reparseScheduler.isCurrent():
+            self._pendingAutocomplete = True # Once the current code is parsed, see _onParsed
+            return
+        self._pendingAutocomplete = False
         if self.tokens != None and self.projectIndex != None:
             cursorPosition = self.window.textField.textCursor().position()
             
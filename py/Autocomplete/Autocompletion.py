@@ -22,7 +22,7 @@ class Autocompletion:
         
         self.node = None
         if self.syntaxTree != None:
-            self.node = self.syntaxTree.findAtOffset(offset)
+            self.node = self.syntaxTree.positionIndex().nodeAt(offset)
         
     def provide(self):
         results = []
@@ -64,10 +64,13 @@ class Autocompletion:
         
 
     def tokenAt(self, position):
-        for token in self.tokens:
-            if token.offset < position and (token.offset + len(token.code)) >= position:
-                return token
-        return None
+        # The token that contains the position or ends right at it (in front of the cursor)
+        if self.syntaxTree == None or position <= 0:
+            return None
+        token = self.syntaxTree.positionIndex().tokenAt(position - 1)
+        if token == None or not self.language.isNodeRelevantForGrammar(token):
+            return None
+        return token
         
 class AutocompletionOffer:
     def __init__(self, offset, length, text, priority):
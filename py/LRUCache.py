@@ -0,0 +1,71 @@
+
+from collections import OrderedDict
+from typing import Any, Hashable
+
+class LRUCache:
+    # Keeps the most recently used entries, limited by the number of entries and by an
+    # approximate number of bytes. The cache cannot measure its entries, callers pass an
+    # estimated size along with every entry. The newest entry is never evicted, even if it 
+    # alone is bigger than the byte-budget.
+
+    def __init__(self, maxEntries: int, maxBytes: int = None):
+        assert maxEntries > 0
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+        self.misses += 1
+        return default
+        
+    def set(self, key: Hashable, value: Any, size: int = 0) -> None:
+        self.pop(key)
+        self._entries[key] = (value, size)
+        self.bytes += size
+        self._evict()
+        
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        if key in self._entries:
+            (value, size) = self._entries.pop(key)
+            self.bytes -= size
+            return value
+        return default
+        
+    def clear(self) -> None:
+        self._entries.clear()
+        self.bytes = 0
+        
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+        
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+        
+    def __len__(self) -> int:
+        return len(self._entries)
+        
+    def __repr__(self) -> str:
+        return "<LRUCache %s>" % str(self.stats())
+        
+    def _evict(self) -> None:
+        while len(self._entries) > 1:
+            if len(self._entries) <= self.maxEntries:
+                if self.maxBytes == None or self.bytes <= self.maxBytes:
+                    break
+            (key, (value, size)) = self._entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
@@ -2,7 +2,16 @@
 from .AbstractSyntaxTree import ASTNode, ASTBranch
 
 class NodePattern:
-    def matches(self, nodes, index): # boolean
+    # Patterns work on a NodeList, a position in it is a NodeListEntry (None: after the last node).
+    
+    def matches(self, nodes, position): # boolean
+        (matches, end) = self.matchSpan(nodes, position)
+        return matches
+        
+    def matchSpan(self, nodes, position): # return (boolean, NodeListEntry|None)
+        # Lookahead: tells whether this pattern matches at position and which nodes mutate would
+        # combine (from position up to and including the returned end) without changing anything.
+        # The end is None if the pattern matches, but mutate would not combine any nodes.
         raise NotImplementedError
 
     def nodeKeys(self): # list(string)
@@ -14,13 +23,18 @@ class NodePattern:
         # node- / grammar-key that new nodes of this pattern would have
         raise NotImplementedError
         
-    def mutate(self, nodes, index): # return (replacedNodes, newNodeIndex)
+    def collectKeys(self, keys):
+        # Adds every node-key and token-code that this pattern (or any pattern in it) compares
+        # nodes with to the set keys, see Language.grammarKeys
+        raise NotImplementedError
+        
+    def mutate(self, nodes, position): # return (replacedNodes, newNodePosition)
         # mutates nodes to combine some nodes into a new node
         #
         # returns all nodes that were removed as replacedNodes
-        # returns the index of the newly created node as newNodeIndex
-        # if no mutation happened, original index is returned as newNodeIndex
-        # On failure, None is returned as newNodeIndex (has to be handled by caller)
+        # returns the position of the newly created node as newNodePosition
+        # if no mutation happened, original position is returned as newNodePosition
+        # On failure, None is returned as newNodePosition (has to be handled by caller)
         raise NotImplementedError
         
 class OptionalNode(NodePattern):
@@ -28,8 +42,12 @@ class OptionalNode(NodePattern):
         assert isinstance(pattern, (str, ASTNode, NodePattern))
         self.pattern = pattern
 
-    def matches(self, nodes, index):
+    def matches(self, nodes, position):
         return True
+        
+    def matchSpan(self, nodes, position): # return (boolean, NodeListEntry|None)
+        (matches, end) = self.pattern.matchSpan(nodes, position)
+        return (True, end)
 
     def nodeKeys(self): # list(string)
         return self.pattern.nodeKeys()
@@ -37,9 +55,12 @@ class OptionalNode(NodePattern):
     def producedNodeKey(self): # string
         return self.pattern.producedNodeKey()
         
-    def mutate(self, nodes, index): # return (replacedNodes, newNodeIndex)
-        if self.pattern.matches(nodes, index):
-            return self.pattern.mutate(nodes, index)
+    def collectKeys(self, keys):
+        self.pattern.collectKeys(keys)
+        
+    def mutate(self, nodes, position): # return (replacedNodes, newNodePosition)
+        if self.pattern.matches(nodes, position):
+            return self.pattern.mutate(nodes, position)
         return ([], None)
         
 class NodeSequence(NodePattern):
@@ -53,51 +74,57 @@ class NodeSequence(NodePattern):
     def producedNodeKey(self): # string
         return self._sequenceType
         
-    def matches(self, nodes, index):
-        nodes = nodes.copy()
+    def collectKeys(self, keys):
+        keys.add(self._sequenceType)
         for pattern in self._elements:
-            if len(nodes) <= index:
+            pattern.collectKeys(keys)
+        
+    def matchSpan(self, nodes, position): # return (boolean, NodeListEntry|None)
+        return nodes.matchSpan(self, position, self._matchSpan)
+        
+    def _matchSpan(self, nodes, position): # return (boolean, NodeListEntry|None)
+        end = position
+        for pattern in self._elements:
+            if position == None:
                 break
-            if pattern.matches(nodes, index):
-                (replacedNodes, newNodeIndex) = pattern.mutate(nodes, index)
-                #if newNodeIndex == None:
-                #    return False
-                if newNodeIndex != None:
-                    index = newNodeIndex + 1
-            elif pattern.producedNodeKey() == nodes[index].grammarKey():
-                index += 1
+            (matches, elementEnd) = pattern.matchSpan(nodes, position)
+            if matches:
+                if elementEnd != None:
+                    end = elementEnd
+                    position = nodes.next(elementEnd)
+            elif pattern.producedNodeKey() == nodes.node(position).grammarKey():
+                end = position
+                position = nodes.next(position)
             else:
-                return False
-        return True
+                return (False, None)
+        return (True, end)
 
-    def mutate(self, nodes, index): # return (replacedNodes, newNodeIndex)
+    def mutate(self, nodes, position): # return (replacedNodes, newNodePosition)
         allNewNodes = []
         allReplacedNodes = []
         
-        start = index
-        end = index
+        # Sub-patterns only ever produce nodes at the position they were given, so the sequence
+        # starts at the given position and ends at the last position that was consumed.
+        start = position
+        end = position
         
         for pattern in self._elements:
-            if len(nodes) <= index:
+            if position == None:
                 break
-            if pattern.matches(nodes, index):
-                (replacedNodes, newNodeIndex) = pattern.mutate(nodes, index)
-                if newNodeIndex != None:
-                    allNewNodes.append(nodes[newNodeIndex])
+            if pattern.matches(nodes, position):
+                (replacedNodes, newNodePosition) = pattern.mutate(nodes, position)
+                if newNodePosition != None:
+                    allNewNodes.append(nodes.node(newNodePosition))
                     allReplacedNodes += replacedNodes
-                    start = min(start, newNodeIndex)
-                    end = max(end, newNodeIndex)
-                    index = newNodeIndex + 1
-            elif pattern.producedNodeKey() == nodes[index].grammarKey():
-                allNewNodes.append(nodes[index])
-                start = min(start, index)
-                end = max(end, index)
-                index += 1
-                
-        for subIndex in reversed(range(start + 1, end + 1)):
-            nodes.pop(subIndex)
+                    end = newNodePosition
+                    position = nodes.next(newNodePosition)
+            elif pattern.producedNodeKey() == nodes.node(position).grammarKey():
+                allNewNodes.append(nodes.node(position))
+                end = position
+                position = nodes.next(position)
                 
-        nodes[start] = ASTBranch(allNewNodes, self._sequenceType)
+        nodes.removeAfter(start, end)
+        nodes.replace(start, ASTBranch(allNewNodes, self._sequenceType))
         
         return (allReplacedNodes, start)
         
@@ -118,28 +145,39 @@ class NodeBranch(NodePattern):
     def producedNodeKey(self): # string
         return self._newNodeType
         
-    def matches(self, nodes, index):
-        nodeKey = nodes[index].grammarKey()
+    def collectKeys(self, keys):
+        keys.add(self._newNodeType)
+        for nodeKey in self._patternMap:
+            for pattern in self._patternMap[nodeKey]:
+                pattern.collectKeys(keys)
+        
+    def matchSpan(self, nodes, position): # return (boolean, NodeListEntry|None)
+        return nodes.matchSpan(self, position, self._matchSpan)
+        
+    def _matchSpan(self, nodes, position): # return (boolean, NodeListEntry|None)
+        nodeKey = nodes.node(position).grammarKey()
         if nodeKey in self._patternMap:
             for pattern in self._patternMap[nodeKey]:
-                if pattern.producedNodeKey() == nodes[index].grammarKey():
-                    return True
-                if pattern.matches(nodes, index):
-                    return True
-        return False
+                if pattern.producedNodeKey() == nodeKey:
+                    return (True, position)
+                (matches, end) = pattern.matchSpan(nodes, position)
+                if matches:
+                    return (True, end)
+        return (False, None)
 
-    def mutate(self, nodes, index): # return (replacedNodes, newNodeIndex)
-        nodeKey = nodes[index].grammarKey()
+    def mutate(self, nodes, position): # return (replacedNodes, newNodePosition)
+        nodeKey = nodes.node(position).grammarKey()
         if nodeKey in self._patternMap:
             for pattern in self._patternMap[nodeKey]:
-                if pattern.producedNodeKey() == nodes[index].grammarKey():
-                    replacedNode = nodes[index]
-                    nodes[index] = ASTBranch([nodes[index]], self._newNodeType)
-                    return ([replacedNode], index)
-                if pattern.matches(nodes, index):
-                    (replacedNodes, newNodeIndex) = pattern.mutate(nodes, index)
-                    nodes[newNodeIndex] = ASTBranch([nodes[newNodeIndex]], self._newNodeType)
-                    return (replacedNodes, newNodeIndex)
+                if pattern.producedNodeKey() == nodeKey:
+                    replacedNode = nodes.node(position)
+                    nodes.replace(position, ASTBranch([replacedNode], self._newNodeType))
+                    return ([replacedNode], position)
+                if pattern.matches(nodes, position):
+                    (replacedNodes, newNodePosition) = pattern.mutate(nodes, position)
+                    newNode = ASTBranch([nodes.node(newNodePosition)], self._newNodeType)
+                    nodes.replace(newNodePosition, newNode)
+                    return (replacedNodes, newNodePosition)
         return ([], None)
         
 class RepeatingNode(NodePattern):
@@ -154,44 +192,63 @@ class RepeatingNode(NodePattern):
     def producedNodeKey(self): # string
         return self._elementType
         
-    def matches(self, nodes, index):
+    def collectKeys(self, keys):
+        keys.add(self._elementType)
+        self._pattern.collectKeys(keys)
+        
+    def matches(self, nodes, position):
         if self._optional:
             return True
         else:
-            return self._pattern.matches(nodes, index)
+            return self._pattern.matches(nodes, position)
+            
+    def matchSpan(self, nodes, position): # return (boolean, NodeListEntry|None)
+        return nodes.matchSpan(self, position, self._matchSpan)
+        
+    def _matchSpan(self, nodes, position): # return (boolean, NodeListEntry|None)
+        if not self.matches(nodes, position):
+            return (False, None)
+        end = None
+        while position != None:
+            (matches, elementEnd) = self._pattern.matchSpan(nodes, position)
+            if matches:
+                end = elementEnd
+                position = nodes.next(elementEnd)
+            elif nodes.node(position).grammarKey() == self._pattern.producedNodeKey():
+                position = nodes.next(position)
+            else:
+                break
+        return (True, end)
 
-    def mutate(self, nodes, index): # return (replacedNodes, newNodeIndex)
+    def mutate(self, nodes, position): # return (replacedNodes, newNodePosition)
         allReplacedNodes = []
         allNewNodes = []
-        start = index
-        end = index
+        start = position
+        end = position
         
-        nodeKeys = self.nodeKeys()
         while True:
-            if len(nodes) <= index:
+            if position == None:
                 break
             #if self._pattern.producedNodeKey() == "tuple-element":
             #    breakpoint()
-            if self._pattern.matches(nodes, index):
-                (replacedNodes, newNodeIndex) = self._pattern.mutate(nodes, index)
+            if self._pattern.matches(nodes, position):
+                (replacedNodes, newNodePosition) = self._pattern.mutate(nodes, position)
                 
-                start = min(start, newNodeIndex)
-                end = max(end, newNodeIndex)
+                end = newNodePosition
                 
                 allReplacedNodes += replacedNodes
-                allNewNodes.append(nodes[newNodeIndex])
+                allNewNodes.append(nodes.node(newNodePosition))
                 
-                index = newNodeIndex + 1
-            elif nodes[index].grammarKey() == self._pattern.producedNodeKey():
-                index += 1
+                position = nodes.next(newNodePosition)
+            elif nodes.node(position).grammarKey() == self._pattern.producedNodeKey():
+                position = nodes.next(position)
             else:
                 break
             
-        for subIndex in reversed(range(start + 1, end + 1)):
-            nodes.pop(subIndex)
+        nodes.removeAfter(start, end)
             
         if len(allNewNodes) > 0:
-            nodes[start] = ASTBranch(allNewNodes, self._elementType)
+            nodes.replace(start, ASTBranch(allNewNodes, self._elementType))
         else:
             start = None
         
@@ -215,11 +272,20 @@ class LateDefinedASTPattern(NodePattern):
         assert isinstance(self._pattern, NodePattern)
         return self._pattern.producedNodeKey()
         
-    def matches(self, nodes, index):
+    def collectKeys(self, keys):
+        # The pattern usually contains this one again somewhere
+        assert isinstance(self._pattern, NodePattern)
+        if self in keys:
+            return
+        keys.add(self)
+        self._pattern.collectKeys(keys)
+        keys.discard(self)
+        
+    def matchSpan(self, nodes, position): # return (boolean, NodeListEntry|None)
         assert isinstance(self._pattern, NodePattern)
-        return self._pattern.matches(nodes, index)
+        return nodes.matchSpan(self, position, self._pattern.matchSpan)
 
-    def mutate(self, nodes, index): # return (replacedNodes, newNodeIndex)
+    def mutate(self, nodes, position): # return (replacedNodes, newNodePosition)
         assert isinstance(self._pattern, NodePattern)
-        return self._pattern.mutate(nodes, index)
+        return self._pattern.mutate(nodes, position)
         
\ No newline at end of file
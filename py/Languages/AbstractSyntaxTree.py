@@ -1,21 +1,43 @@
+from types import MappingProxyType
+import bisect
 
-class ASTNode:
-    def __init__(self, language, code, row, col, offset, type, parent=None):
+# Most nodes (all tokens) never get children, attributes, prepended or appended nodes. 
+# Instead of allocating empty containers for each of them, they all share these read-only 
+# empty ones until something gets written (see prepend, append, setAttribute).
+NO_NODES = ()
+NO_ATTRIBUTES = MappingProxyType({})
+
+class SourceBuffer:
+    # The (line-ending normalized) code that all nodes of one syntax-tree were parsed from.
+    # Branches do not keep a copy of their code, they only know where it is in here (see
+    # ASTBranch.code). An incremental parse replaces the text instead of the buffer, which
+    # keeps all re-used nodes pointing to the current code.
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+class ASTNode: # abstract, subclasses provide the code of the node
+    __slots__ = (
+        'language', 'row', '_lastRow', 'col', 'offset', 'type', 'parent', 
+        'children', 'attributes', 'prepended', 'appended'
+    )
+
+    def __init__(self, language, row, col, offset, type, parent=None):
         self.language = language
-        self.code = code
         self.row = row
         self._lastRow = None
         self.col = col
         self.offset = offset
         self.type = type
         self.parent = parent
-        self.children = []
-        self.attributes = {}
+        self.children = NO_NODES
+        self.attributes = NO_ATTRIBUTES
         
         # Nodes in these two categories are part of the AST but have no semantic impact.
         # F.e.: Whitespace, Comments, ...
-        self.prepended = []
-        self.appended = []
+        self.prepended = NO_NODES
+        self.appended = NO_NODES
         
     def filepath(self):
         assert(isinstance(self.parent, ASTNode))
@@ -26,11 +48,28 @@ class ASTNode:
             self._lastRow = self.row + self.code.count("\n")
         return self._lastRow
 
+    def shift(self, offsetDelta, rowDelta, colDelta=0):
+        # Moves this node after the code in front of it was changed
+        self.offset += offsetDelta
+        self.row += rowDelta
+        self.col += colDelta
+        if self._lastRow != None:
+            self._lastRow += rowDelta
+
     def prepend(self, node):
+        if self.prepended is NO_NODES:
+            self.prepended = []
         self.prepended.append(node)
         
     def append(self, node):
+        if self.appended is NO_NODES:
+            self.appended = []
         self.appended.append(node)
+        
+    def setAttribute(self, key, value):
+        if self.attributes is NO_ATTRIBUTES:
+            self.attributes = {}
+        self.attributes[key] = value
 
     def reconstructCode(self):
         code = ""
@@ -47,46 +86,87 @@ class ASTNode:
         elif type(selector) == str:
             return self.grammarKey() == selector
 
-    def find(self, selector): # list[ASTNode]
-        result = []
-        for child in self.children:
-            result += child.find(selector)
-        if self.matches(selector):
-            result.append(self)
-        return result
-        
-    def findInPrepended(self, selector): # list[ASTNode]
-        result = []
-        if len(self.children) > 0:
-            result = self.children[0].findInPrepended(selector)
-        for child in self.prepended:
-            result += child.find(selector)
-        if self.matches(selector):
-            result.append(self)
-        return result
-        
-    def findInAppended(self, selector): # list[ASTNode]
-        result = []
-        if len(self.children) > 0:
-            result = self.children[-1].findInAppended(selector)
-        for child in self.appended:
-            result += child.find(selector)
-        if self.matches(selector):
-            result.append(self)
-        return result
-        
-    def findAtOffset(self, offset):
-        for child in self.children:
-            if child.isAtOffset(offset):
-                return child.findAtOffset(offset)
-        if self.isAtOffset(offset):
-            return self
+    def find(self, selector): # iterator<ASTNode>
+        # This node and all nodes in it that match the selector, lazily and in document order.
+        # Prepended and appended nodes are not searched (see findInPrepended, findInAppended).
+        if type(selector) == str:
+            root = self.root()
+            if root != None:
+                return root.findInSubtree(selector, self)
+        return self._findAll(selector)
+        
+    def _findAll(self, selector): # generator<ASTNode>
+        stack = [self]
+        while len(stack) > 0:
+            node = stack.pop()
+            if node.matches(selector):
+                yield node
+            stack.extend(reversed(node.children))
+        
+    def findInPrepended(self, selector): # generator<ASTNode>
+        # The matching nodes in front of the code of this node (in the prepended nodes of this 
+        # node and its first descendants) in document order, followed by this node and these
+        # descendants themselves if they match.
+        chain = []
+        node = self
+        while True:
+            chain.append(node)
+            for predecessor in node.prepended:
+                yield from predecessor._findAll(selector)
+            if len(node.children) <= 0:
+                break
+            node = node.children[0]
+        for node in chain:
+            if node.matches(selector):
+                yield node
+        
+    def findInAppended(self, selector): # generator<ASTNode>
+        # Like findInPrepended, but for the nodes behind the code of this node
+        chain = []
+        node = self
+        while True:
+            chain.append(node)
+            if len(node.children) <= 0:
+                break
+            node = node.children[-1]
+        for node in reversed(chain):
+            for successor in node.appended:
+                yield from successor._findAll(selector)
+        for node in chain:
+            if node.matches(selector):
+                yield node
+        
+    def root(self): # ASTRoot|None
+        node = self
+        while node.parent != None:
+            node = node.parent
+        if isinstance(node, ASTRoot):
+            return node
         return None
+        
+    def findAtOffset(self, offset): # ASTNode|None
+        # The innermost node at the offset, this node or one of its descendants (not of the
+        # prepended or appended nodes). Children are in document order, so on each level only
+        # the last child starting at or before the offset can contain it.
+        if not self.isAtOffset(offset):
+            return None
+        node = self
+        while len(node.children) > 0:
+            index = bisect.bisect_right(node.children, offset, key=nodeOffset) - 1
+            if index < 0 or not node.children[index].isAtOffset(offset):
+                break
+            node = node.children[index]
+        return node
             
     def isAtOffset(self, offset):
-        if self.offset > offset:
-            return False
-        return self.offset + len(self.code) > offset
+        return self.offset <= offset and offset < self.endOffset()
+        
+    def codeLength(self): # int
+        return len(self.code)
+        
+    def endOffset(self): # int
+        # Offset right after the last character of code (which starts at offset)
+        return self.offset + len(self.code)
         
     def hasParentWith(self, selector): # bool
         if self.parent != None:
@@ -96,12 +176,6 @@ class ASTNode:
                 return True
         return False
         
-    def offsetIn(self, nodes):
-        for index in range(0, len(nodes)):
-            if nodes[index] == self:
-                return index
-        return None
-        
     def grammarKey(self):
         return self.type
         
@@ -121,35 +195,142 @@ class ASTNode:
     def previousChild(self, next):
         return None
         
-    def buildDeltaTree(self, otherNode):
-        newNode = self
+    def buildDeltaTree(self, otherNode): # list<ASTNode>
+        # The (top-most) nodes of this tree that differ from the tree of otherNode. Nodes that 
+        # were re-used by an incremental parse are the same objects and are skipped right away.
+        if self is otherNode:
+            return []
         
-        if self.code == otherNode.code and self.offset == otherNode.offset:
-            return None # No!
+        if self.grammarKey() != otherNode.grammarKey() or self.offset != otherNode.offset:
+            return [self]
         
+        if len(self.children) != len(otherNode.children):
+            return [self]
+        if self.codeLength() != otherNode.codeLength() or self.code != otherNode.code:
+            return [self]
+            
+        if len(self.children) <= 0:
+            if self.reconstructCode() != otherNode.reconstructCode():
+                return [self]
+            return []
+        
+        changedNodes = []
+        for index in range(0, len(self.children)):
+            changedNodes += self.children[index].buildDeltaTree(otherNode.children[index])
         return changedNodes
         
-    def findChangedLinesFrom(self, otherNode):
+    def findChangedLinesFrom(self, otherNode): # list<int>
         changedLines = [] # list<int>
+        for node in self.buildDeltaTree(otherNode):
+            for line in range(node.row, node.lastRow() + 1):
+                if len(changedLines) <= 0 or changedLines[-1] < line:
+                    changedLines.append(line)
+        return changedLines
         
+    def codeStart(self): # int
+        # Offset of the first character of reconstructCode(), including prepended nodes
+        return self.firstCodeNode().offset
         
+    def codeEnd(self): # int
+        # Offset right after the last character of reconstructCode(), including appended nodes
+        node = self
+        while True:
+            if len(node.appended) > 0:
+                node = node.appended[-1]
+            elif len(node.children) > 0:
+                node = node.children[-1]
+            else:
+                return node.offset + node.codeLength()
         
-        return changedLines
+    def firstCodeNode(self): # ASTNode
+        # The (leaf-)node with the first character of reconstructCode()
+        node = self
+        while True:
+            if len(node.prepended) > 0:
+                node = node.prepended[0]
+            elif len(node.children) > 0:
+                node = node.children[0]
+            else:
+                return node
+                
+    def tokensBetween(self, start, end): # list<ASTNode>
+        # The leaf-nodes with code in and around this node (including prepended and appended
+        # ones) that overlap the offsets start to end, in document order. Only descends into
+        # nodes that overlap, so a small range costs the same in a small and in a big tree.
+        tokens = []
+        stack = [self]
+        while len(stack) > 0:
+            node = stack.pop()
+            if type(node) == tuple: # The node itself, after its prepended nodes
+                tokens.append(node[0])
+                continue
+            for appended in reversed(node.appended):
+                if appended.codeStart() < end and start < appended.codeEnd():
+                    stack.append(appended)
+            children = node.children
+            if len(children) > 0:
+                # Children are only skipped by their offsets, which leave out their prepended
+                # nodes: the last child that starts in front of start may still reach it, the
+                # first one that starts at end or later may have prepended nodes in front of it.
+                first = max(0, bisect.bisect_right(children, start, key=nodeOffset) - 1)
+                last = min(len(children), bisect.bisect_left(children, end, first, key=nodeOffset) + 1)
+                for index in range(last - 1, first - 1, -1):
+                    stack.append(children[index])
+            elif node.offset < end and start < node.offset + node.codeLength():
+                stack.append((node,))
+            for prepended in reversed(node.prepended):
+                if prepended.codeStart() < end and start < prepended.codeEnd():
+                    stack.append(prepended)
+        return tokens
+        
+    def firstLeaf(self): # ASTNode
+        node = self
+        while len(node.children) > 0:
+            node = node.children[0]
+        return node
+        
+    def lastLeaf(self): # ASTNode
+        node = self
+        while len(node.children) > 0:
+            node = node.children[-1]
+        return node
+        
+    def shiftTree(self, offsetDelta, rowDelta, colDelta=0, colRow=None):
+        # Moves this node and all nodes in and around it, the colDelta only applies to nodes on
+        # the (previous) row colRow. Iterative and without calling shift, this touches every
+        # node behind an edit.
+        stack = [self]
+        while len(stack) > 0:
+            node = stack.pop()
+            stack.extend(node.prepended)
+            stack.extend(node.children)
+            stack.extend(node.appended)
+            if node.row == colRow:
+                node.col += colDelta
+            node.offset += offsetDelta
+            node.row += rowDelta
+            if node._lastRow != None:
+                node._lastRow += rowDelta
+            
+    def replaceCode(self, start, end, code):
+        # Replaces the code between start and end (relative to this node)
+        self.code = self.code[:start] + code + self.code[end:]
+        self._lastRow = None
 
 class ASTBranch(ASTNode):
-    def __init__(self, children, type, parent=None):
+    # The code of a branch is that of its children (including their prepended and appended
+    # nodes), which is a span of the source-buffer starting at the first of its tokens. Only
+    # the length of that span is stored, so building a branch does not copy any code.
+    __slots__ = ('_length', '_childToIndex')
+
+    def __init__(self, children, type, parent=None, length=None):
+        # length: of the code, if it is already known (see NodeReader)
         firstChild = children[0]
-        self._childToIndex = {}
-        code = ""
-        index = 0
+        self._childToIndex = None # Built on first use, most branches are never navigated
         for child in children:
-            code += child.reconstructCode()
             child.parent = self
-            self._childToIndex[child] = index
-            index += 1
         super().__init__(
             firstChild.language,
-            code,
             firstChild.row,
             firstChild.col,
             firstChild.offset,
@@ -157,26 +338,205 @@ class ASTBranch(ASTNode):
             parent
         )
         self.children = children
-        self.parent = parent
+        if length == None:
+            length = children[-1].codeEnd() - firstChild.codeStart()
+        self._length = length
+        
+    @property
+    def code(self): # string
+        (text, start, end) = self._span()
+        return text[start:end]
+        
+    def codeLength(self): # int
+        return self._length
+        
+    def endOffset(self): # int
+        # The code starts in front of offset if the first child has prepended nodes
+        return self._span()[2]
+        
+    def lastRow(self):
+        if self._lastRow == None:
+            (text, start, end) = self._span()
+            self._lastRow = self.row + text.count("\n", start, end)
+        return self._lastRow
+        
+    def replaceCode(self, start, end, code):
+        # The code itself is replaced in the source-buffer (see Language._reparse)
+        self._length += len(code) - (end - start)
+        self._lastRow = None
+        
+    def _span(self): # (string, int, int): the source-buffer text and the range of the code in it
+        if len(self.children) <= 0:
+            return ("", 0, 0)
+        first = self.children[0].firstCodeNode()
+        return (first.source.text, first.offset, first.offset + self._length)
     
     def nextChild(self, previous):
-        index = self._childToIndex[previous] + 1
+        index = self.childIndex(previous) + 1
         if index < len(self.children):
             return self.children[index]
         else:
             return None
         
     def previousChild(self, next):
-        index = self._childToIndex[next] - 1
+        index = self.childIndex(next) - 1
         if index >= 0:
             return self.children[index]
         else:
             return None
             
+    def replaceChildren(self, start, end, children):
+        # Replaces the children [start:end] with the given ones. Does not change the code.
+        self.children[start:end] = children
+        for child in children:
+            child.parent = self
+        self._childToIndex = None
+            
+    def childIndex(self, child): # int
+        if self._childToIndex == None:
+            self._childToIndex = {}
+            for index in range(0, len(self.children)):
+                self._childToIndex[self.children[index]] = index
+        return self._childToIndex[child]
+            
 class ASTRoot(ASTBranch):
+    __slots__ = ('_filepath', 'revision', '_nodesByKey', '_nodesByKeyRevision', '_positionIndex')
+
     def __init__(self, children, filepath):
         self._filepath = filepath
+        self.revision = 0 # Increased whenever the tree gets changed in place
+        
+        # grammar-key => list of all nodes of the tree with that key (except for prepended and
+        # appended nodes) in document order. Built on the first search, for the current revision.
+        self._nodesByKey = None
+        self._nodesByKeyRevision = None
+        self._positionIndex = None # PositionIndex, see positionIndex
         super().__init__(children, "root")
         
     def filepath(self):
-        return self._filepath
\ No newline at end of file
+        return self._filepath
+        
+    def findInSubtree(self, grammarKey, node): # iterator<ASTNode>
+        # The nodes with the grammar-key in node (which must be part of this tree, but not of
+        # prepended or appended nodes) including node itself, in document order.
+        nodes = self.nodesByKey().get(grammarKey, NO_NODES)
+        if node is self:
+            return iter(nodes)
+        return self._findInRange(grammarKey, nodes, node)
+        
+    def _findInRange(self, grammarKey, nodes, node): # generator<ASTNode>
+        # Document order is also the order of the offsets, and the subtree of a node is
+        # exactly the nodes starting between its offset and the end of its code, except for
+        # the ancestors that start at the same offset.
+        if node.codeLength() <= 0:
+            if node.grammarKey() == grammarKey: # f.e. an empty code-block, there is nothing in it
+                yield node
+            return
+        ancestors = []
+        ancestor = node.parent
+        while ancestor != None and ancestor.offset == node.offset:
+            ancestors.append(ancestor)
+            ancestor = ancestor.parent
+        end = node.codeEnd()
+        for index in range(bisect.bisect_left(nodes, node.offset, key=nodeOffset), len(nodes)):
+            candidate = nodes[index]
+            if candidate.offset >= end:
+                break
+            if not any(candidate is ancestor for ancestor in ancestors):
+                yield candidate
+        
+    def nodesByKey(self): # dict(string => list<ASTNode>), do not modify
+        if self._nodesByKey == None or self._nodesByKeyRevision != self.revision:
+            nodesByKey = {}
+            stack = [self]
+            while len(stack) > 0:
+                node = stack.pop()
+                key = node.grammarKey()
+                if key in nodesByKey:
+                    nodesByKey[key].append(node)
+                else:
+                    nodesByKey[key] = [node]
+                stack.extend(reversed(node.children))
+            self._nodesByKey = nodesByKey
+            self._nodesByKeyRevision = self.revision
+        return self._nodesByKey
+        
+    def positionIndex(self): # PositionIndex
+        # Shared by everything that looks up nodes by offset or line, for the current revision
+        if self._positionIndex == None or self._positionIndex.revision != self.revision:
+            self._positionIndex = PositionIndex(self)
+        return self._positionIndex
+        
+    def tokensBetween(self, start, end): # list<ASTNode>
+        # From the position index, if it was already built for the current revision
+        if self._positionIndex != None and self._positionIndex.revision == self.revision:
+            return self._positionIndex.tokensBetween(start, end)
+        return super().tokensBetween(start, end)
+        
+class PositionIndex:
+    # Answers where-questions about one syntax-tree: which token is at an offset, which tokens
+    # are on a line and which node covers a range. All tokens (including those of prepended
+    # and appended nodes) are kept in document order, which is also the order of their offsets
+    # and rows, so each lookup is a binary search instead of a walk over the tree.
+    __slots__ = ('root', 'revision', '_tokens', '_offsets', '_rows', '_lastRows')
+    
+    def __init__(self, root):
+        self.root = root
+        self.revision = root.revision
+        self._tokens = [] # The leaf-nodes with code, in document order
+        stack = [root]
+        while len(stack) > 0:
+            node = stack.pop()
+            if type(node) == tuple: # The node itself, after its prepended nodes
+                self._tokens.append(node[0])
+                continue
+            stack.extend(reversed(node.appended))
+            if len(node.children) > 0:
+                stack.extend(reversed(node.children))
+            elif node.codeLength() > 0:
+                stack.append((node,))
+            stack.extend(reversed(node.prepended))
+        self._offsets = [token.offset for token in self._tokens]
+        self._rows = [token.row for token in self._tokens]
+        self._lastRows = [token.lastRow() for token in self._tokens]
+        
+    def tokenAt(self, offset): # ASTNode|None
+        index = bisect.bisect_right(self._offsets, offset) - 1
+        if index >= 0 and offset < self._offsets[index] + self._tokens[index].codeLength():
+            return self._tokens[index]
+        return None
+        
+    def tokensBetween(self, start, end): # list<ASTNode>
+        # The tokens that overlap the offsets start to end, in document order
+        index = bisect.bisect_right(self._offsets, start) - 1
+        if index < 0 or start >= self._offsets[index] + self._tokens[index].codeLength():
+            index += 1
+        return self._tokens[index:bisect.bisect_left(self._offsets, end, index)]
+        
+    def tokensOnLine(self, line): # list<ASTNode>
+        # The tokens that start, end or continue on the line, in document order
+        start = bisect.bisect_left(self._lastRows, line)
+        end = bisect.bisect_right(self._rows, line)
+        return self._tokens[start:end]
+        
+    def nodeAt(self, offset): # ASTNode|None
+        return self.root.findAtOffset(offset)
+        
+    def nodeCovering(self, start, end): # ASTNode|None
+        # The innermost node (not a prepended or appended one) that contains all code between
+        # start and end
+        if not self._covers(self.root, start, end):
+            return None
+        node = self.root
+        while len(node.children) > 0:
+            index = bisect.bisect_right(node.children, start, key=nodeOffset) - 1
+            if index < 0 or not self._covers(node.children[index], start, end):
+                break
+            node = node.children[index]
+        return node
+        
+    def _covers(self, node, start, end): # bool
+        return node.offset <= start and end <= node.endOffset() and start < node.endOffset()
+        
+def nodeOffset(node): # int
+    return node.offset
\ No newline at end of file
@@ -0,0 +1,132 @@
+import time
+
+from .ASTPatterns import NodePattern
+
+class GrammarProfile:
+    # Counts and times how often the patterns of a grammar get tried and applied, per pattern
+    # and per grammar-key that the pattern was tried for (see Language.grammarMap). Only the
+    # patterns of the grammar itself are measured, their time includes that of their
+    # sub-patterns (which are shared between patterns and often recursive).
+
+    def __init__(self):
+        self._patterns = [] # ProfiledPattern
+
+    def wrap(self, grammarMap): # dict(string => list<NodePattern>)
+        # The same grammar-map, with each pattern wrapped so that it gets measured
+        profiledMap = {}
+        for key in grammarMap:
+            profiledMap[key] = []
+            for pattern in grammarMap[key]:
+                profiledPattern = ProfiledPattern(pattern, key)
+                self._patterns.append(profiledPattern)
+                profiledMap[key].append(profiledPattern)
+        return profiledMap
+
+    def reset(self):
+        for pattern in self._patterns:
+            pattern.reset()
+
+    def isEmpty(self): # boolean
+        return all(pattern.calls == 0 for pattern in self._patterns)
+
+    def report(self, title): # string
+        # All patterns that were tried and the totals per grammar-key, most time consuming first
+        patterns = [pattern for pattern in self._patterns if pattern.calls > 0]
+        patterns.sort(key=lambda pattern: -pattern.time())
+
+        keys = {} # grammar-key => [calls, matched, seconds, mutations, produced, replaced]
+        for pattern in patterns:
+            if pattern.key not in keys:
+                keys[pattern.key] = [0, 0, 0.0, 0, 0, 0]
+            totals = keys[pattern.key]
+            totals[0] += pattern.calls
+            totals[1] += pattern.matched
+            totals[2] += pattern.time()
+            totals[3] += pattern.mutations
+            totals[4] += pattern.produced
+            totals[5] += pattern.replaced
+
+        totalTime = sum(pattern.time() for pattern in patterns)
+        lines = [title + ": %.1f ms in the grammar" % (totalTime * 1000)]
+        lines.append("")
+        lines.append("per pattern:")
+        for pattern in patterns:
+            lines.append(self._line(
+                (type(pattern.pattern).__name__ + ":" + pattern.pattern.producedNodeKey()).ljust(40),
+                pattern.key,
+                pattern.calls,
+                pattern.matched,
+                pattern.time(),
+                pattern.mutations,
+                pattern.produced,
+                pattern.replaced
+            ))
+        lines.append("")
+        lines.append("per grammar-key:")
+        for key in sorted(keys, key=lambda key: -keys[key][2]):
+            lines.append(self._line("".ljust(40), key, *keys[key]))
+        return "\n".join(lines) + "\n"
+
+    def _line(self, name, key, calls, matched, seconds, mutations, produced, replaced): # string
+        return " ".join((
+            name,
+            ("key: " + key).ljust(24),
+            "calls:", str(calls).rjust(7),
+            "matched:", str(matched).rjust(7),
+            "(%5.1f%%)" % (100 * matched / max(1, calls)),
+            "ms:", ("%.2f" % (seconds * 1000)).rjust(9),
+            "mutations:", str(mutations).rjust(6),
+            "produced:", str(produced).rjust(6),
+            "replaced:", str(replaced).rjust(6)
+        ))
+
+class ProfiledPattern(NodePattern):
+    # Measures a pattern of the grammar, in place of that pattern (see GrammarProfile.wrap)
+
+    def __init__(self, pattern, key):
+        self.pattern = pattern
+        self.key = key # The grammar-key that the pattern gets tried for
+        self.reset()
+
+    def reset(self):
+        self.calls = 0 # of matches
+        self.matched = 0 # calls of matches that returned True
+        self.matchTime = 0.0 # seconds
+        self.mutations = 0 # calls of mutate
+        self.mutateTime = 0.0 # seconds
+        self.produced = 0 # nodes that were produced by mutate
+        self.replaced = 0 # nodes that were replaced by those
+
+    def time(self): # float, seconds
+        return self.matchTime + self.mutateTime
+
+    def matches(self, nodes, position): # boolean
+        started = time.perf_counter()
+        matches = self.pattern.matches(nodes, position)
+        self.matchTime += time.perf_counter() - started
+        self.calls += 1
+        if matches:
+            self.matched += 1
+        return matches
+
+    def matchSpan(self, nodes, position): # return (boolean, NodeListEntry|None)
+        return self.pattern.matchSpan(nodes, position)
+
+    def nodeKeys(self): # list(string)
+        return self.pattern.nodeKeys()
+
+    def producedNodeKey(self): # string
+        return self.pattern.producedNodeKey()
+
+    def collectKeys(self, keys):
+        self.pattern.collectKeys(keys)
+
+    def mutate(self, nodes, position): # return (replacedNodes, newNodePosition)
+        started = time.perf_counter()
+        (replacedNodes, newNodePosition) = self.pattern.mutate(nodes, position)
+        self.mutateTime += time.perf_counter() - started
+        self.mutations += 1
+        if newNodePosition != None:
+            self.produced += 1
+        self.replaced += len(replacedNodes)
+        return (replacedNodes, newNodePosition)
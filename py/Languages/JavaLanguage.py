@@ -68,7 +68,12 @@ class JavaLanguage(Language):
     def stylesheet(self):
         return CssAsAstStylesheet(os.path.dirname(__file__) + "/java.css")
 
-    def formatForNode(self, node):
+    def codeClass(self, node): # string|None
+        if type(node) == Token and node.tokenName == "T_SYMBOL" and node.code in ["self", "super"]:
+            return node.code
+        return None
+
+    def createFormat(self, node):
         if type(node) == Token: 
             format = QTextCharFormat()
 
@@ -1,25 +1,57 @@
 
-from PySide6.QtGui import QSyntaxHighlighter, QTextCharFormat
-from PySide6.QtCore import Qt
+from PySide6.QtGui import QSyntaxHighlighter, QTextCharFormat, QTextBlockUserData
+from PySide6.QtCore import Qt, QTimer
 
 from enum import Enum
 from collections import OrderedDict
-import re, hashlib
+import re, os, sys, time, hashlib, bisect
 
-from .AbstractSyntaxTree import ASTNode, ASTBranch, ASTRoot
+from .AbstractSyntaxTree import ASTNode, ASTBranch, ASTRoot, SourceBuffer, nodeOffset, NO_NODES
 from .ASTPatterns import NodePattern
+from .NodeList import NodeList
+from .GrammarProfile import GrammarProfile
+from .SemanticASTNodes import CodeBlock
 from .Tokens import Token, TokenMatcher, TokenDef
+from .Lexer import Lexer
 
 from py.Widgets.TextField import TextField
 from py.Widgets.SearchBar import InFileSearchResult
 from py.Hub import Hub, Log, on
+from py.LRUCache import LRUCache
+
+# Rough memory usage per token (not counting the code itself), measured with tracemalloc on python code
+LEXED_BYTES_PER_TOKEN = 20
+PARSED_BYTES_PER_TOKEN = 1000
+
+_grammarVersion = None # see Language.grammarVersion
+
+NO_FORMAT = object() # formatForNode has not created a format for a key yet
+
+# Lines whose format runs are created at once when a line without them gets highlighted
+PREFETCHED_LINES = 64
 
 class Language: # abstract
 
     def __init__(self, hub: Hub):
-        self._lexCache = {}
-        self._parseCache = {} 
+        cacheEntries = int(os.environ.get('EINSICHT_CACHE_ENTRIES', 16))
+        cacheBytes = int(os.environ.get('EINSICHT_CACHE_MB', 128)) * 1024 * 1024
+        self._lexCache = LRUCache(cacheEntries, cacheBytes)
+        self._parseCache = LRUCache(cacheEntries, cacheBytes)
+        self._memoizeMatches = os.environ.get('EINSICHT_PACKRAT', '0') == '1'
         self._grammarMap = None
+        self._grammarKeys = None
+        self._lexer = None
+        self._lastLexed = None # TokenStream
+        self._lastParsed = None # (hash, (ASTRoot, list<Token>), TokenStream)
+        self._diskCache = None # ParseCache, see setParseCache
+        self._formats = {} # format-key => QTextCharFormat|None, see formatForNode
+        
+        # Profiling of the grammar, reported after each parse: EINSICHT_GRAMMAR_PROFILE=1 writes
+        # the report to the log (as does debugEnabled), any other value is a file to append it to.
+        self._grammarProfileFile = os.environ.get('EINSICHT_GRAMMAR_PROFILE', '0')
+        self._grammarProfile = None
+        if self._grammarProfileFile != '0' or self.debugEnabled():
+            self._grammarProfile = GrammarProfile()
         self.hub = hub
         self.hub.register(self)
         
@@ -29,6 +61,25 @@ class Language: # abstract
     def debugEnabled(self):
         return False
         
+    def grammarVersion(self): # string
+        # Changes whenever the way this language is parsed could have changed (see ParseCache):
+        # a hash of all modules in this folder, computed once per process.
+        global _grammarVersion
+        if _grammarVersion == None:
+            folderPath = os.path.dirname(os.path.abspath(__file__))
+            hash = hashlib.md5()
+            for fileName in sorted(os.listdir(folderPath)):
+                if fileName.endswith(".py"):
+                    with open(folderPath + "/" + fileName, "rb") as handle:
+                        hash.update(fileName.encode())
+                        hash.update(handle.read())
+            _grammarVersion = hash.hexdigest()
+        return _grammarVersion
+        
+    def setParseCache(self, parseCache):
+        # ParseCache|None: where syntax-trees of whole files are kept between processes
+        self._diskCache = parseCache
+        
     # Returns QSyntaxHighlighter
     def syntaxHighlighter(self, document, syntaxTree):
         return LanguageFromSyntaxTreeHighlighter(self.hub, document, syntaxTree, self)
@@ -45,7 +96,28 @@ class Language: # abstract
     def stylesheet(self):
         raise NotImplementedError
 
-    def formatForNode(self, node): # QFormat
+    def formatForNode(self, node): # QTextCharFormat|None
+        # Formats are created once per format-key and then shared by all nodes with that key,
+        # so they must not be changed. Empty formats are None.
+        key = self.formatKey(node)
+        format = self._formats.get(key, NO_FORMAT)
+        if format is NO_FORMAT:
+            format = self.createFormat(node)
+            if format != None and format.isEmpty():
+                format = None
+            self._formats[key] = format
+        return format
+        
+    def formatKey(self, node): # tuple
+        # Everything createFormat looks at: (grammar-key, type of the parent, code-class)
+        parent = node.parent
+        return (node.grammarKey(), parent.type if parent != None else None, self.codeClass(node))
+        
+    def codeClass(self, node): # string|None
+        # The part of the code of the node that its format depends on, if any
+        return None
+        
+    def createFormat(self, node): # QTextCharFormat|None
         raise NotImplementedError
 
     def isNodeRelevantForGrammar(self, node): # boolean
@@ -57,188 +129,380 @@ class Language: # abstract
     def autocompleTypesForNode(self, node):
         return []
         
-    def parse(self, code, filepath, previousAST=None, previousTokens=None): # return: [ASTNode, list(TokenNode)]
+    def parse(self, code, filepath, previousAST=None, previousTokens=None, change=None): # return: [ASTNode, list(TokenNode)]
+        # change: (position, removed, added) that turned the previously parsed code into this one
         hash = hashlib.md5(code.encode()).hexdigest()
-        if hash not in self._parseCache:
+        result = self._parseCache.get(hash)
+        if result == None and previousAST == None and self._diskCache != None:
+            result = self._loadFromDisk(hash, code, filepath)
+        if result == None:
         
-            tokens = self.lex(code, previousTokens)
+            stream = self.lex(code, previousTokens, change)
+            size = len(stream) * PARSED_BYTES_PER_TOKEN
             
-            if len(tokens) <= 0:
-                self._parseCache[hash] = (None, tokens)
-                return self._parseCache[hash]
-
-            grammarMap = self.grammarMap()
+            if len(stream) <= 0:
+                result = (None, stream)
+                self._parseCache.set(hash, result, size)
+                self._lastParsed = None
+                return result
+                
+            if previousAST != None:
+                result = self._reparse(previousAST, stream, filepath)
+                
+            if result == None:
+                grammarMap = self.grammarMap()
+                
+                # Hides irrelevant tokens: comments, whitespace, ...
+                tokens = self.normalize(stream.tokens(0, len(stream), SourceBuffer(stream.code)))
+                
+                nodes = tokens.copy()
+                nodes = self._applyGrammar(nodes, grammarMap)
+                nodes = self.groupStatementsIntoBlocks(nodes)
+                
+                if self.debugEnabled():
+                    dumpAST(nodes)
+                    
+                ast = ASTRoot(nodes, filepath)
+                result = (ast, tokens)
+                # Only code as it was opened, not every state of it while being edited
+                if previousAST == None and self._diskCache != None:
+                    self._diskCache.store(self, hash, stream.code, ast, tokens, stream)
+                
+            self._parseCache.set(hash, result, size)
+            self._lastParsed = (hash, result, stream)
             
-            # Hides irrelevant tokens: comments, whitespace, ...
-            tokens = self.normalize(tokens)
+            if self._grammarProfile != None and not self._grammarProfile.isEmpty():
+                self._reportGrammarProfile(filepath)
             
-            nodes = tokens.copy()
-            nodes = self._applyGrammar(nodes, grammarMap)
-            nodes = self.groupStatementsIntoBlocks(nodes)
+        elif hash in self._lexCache:
+            self._lastLexed = self._lexCache.get(hash)
+            self._lastParsed = (hash, result, self._lastLexed)
+            
+        return result
+        
+    def _loadFromDisk(self, hash, code, filepath): # (ASTRoot, list<Token>)|None
+        # The token-stream is restored as well, so that the next change can be parsed 
+        # incrementally (see parse, which takes it from the lex-cache).
+        code = self._normalizeLineEndings(code)
+        loaded = self._diskCache.load(self, hash, code, filepath)
+        if loaded == None:
+            return None
+        (ast, tokens, stream) = loaded
+        result = (ast, tokens)
+        self._lexCache.set(hash, stream, len(stream) * LEXED_BYTES_PER_TOKEN + len(code))
+        self._parseCache.set(hash, result, len(stream) * PARSED_BYTES_PER_TOKEN)
+        return result
+        
+    def _reportGrammarProfile(self, filepath):
+        report = self._grammarProfile.report(self.name() + " grammar profile of " + str(filepath))
+        self._grammarProfile.reset()
+        if self._grammarProfileFile in ('0', '1'):
+            Log.info(report)
+        else:
+            with open(self._grammarProfileFile, "a") as handle:
+                handle.write(report + "\n")
+        
+    def _reparse(self, previousAST, stream, filepath): # (ASTRoot, list<Token>)|None
+        # Incremental parsing: Rebuilds only the top-level statements that were touched by the 
+        # last change and splices the new statements into the previous syntax-tree, in place. 
+        # All other nodes are re-used and moved behind the new statements.
+        #
+        # The grammar can not be applied to some statements alone: Which pattern wins depends on
+        # the order in which the grammar gets to the nodes of the whole code. So this only
+        # handles changes that the grammar can not tell apart from the previous code (see 
+        # rebuildStatements), the result of parsing the new code as a whole is then known to 
+        # have the same structure as the previous syntax-tree.
+        #
+        # Returns None if that is not possible, then the code needs to be parsed as a whole.
+        if self._lastParsed == None or stream.relexed == None:
+            return None
             
-            if self.debugEnabled():
-                dumpAST(nodes)
+        (lastHash, (lastAST, lastTokens), lastStream) = self._lastParsed
+        (previousId, start, end, previousEnd) = stream.relexed
+        if lastAST is not previousAST or lastStream.id != previousId or len(lastTokens) <= 0:
+            return None
+            
+        # The lexer re-lexes a bit more than the change itself; tokens at both ends of that range
+        # which did not change (other than being moved) do not need to be parsed again.
+        delta = len(stream.code) - len(lastStream.code)
+        def unchanged(index, previousIndex, offsetDelta): # boolean
+            return stream.offset(index) == lastStream.offset(previousIndex) + offsetDelta and \
+                stream.tokenName(index) == lastStream.tokenName(previousIndex) and \
+                stream.tokenCode(index) == lastStream.tokenCode(previousIndex)
+        while start < end and start < previousEnd and unchanged(start, start, 0):
+            start += 1
+        while end > start and previousEnd > start and unchanged(end - 1, previousEnd - 1, delta):
+            end -= 1
+            previousEnd -= 1
+
+        lastOffsets = lastStream.offsets()
+        def rawIndex(token): # int: index of a relevant token in the previous token-stream
+            return bisect.bisect_left(lastOffsets, token.offset)
+        def tokenIndex(offset): # int: index of the first relevant token at or after offset
+            return bisect.bisect_left(lastTokens, offset, key=nodeOffset)
+            
+        # The relevant tokens owning the tokens that were lexed again, either directly or as 
+        # their prepended (or, at the end, appended) irrelevant tokens.
+        start = min(start, len(lastStream) - 1)
+        previousEnd = max(previousEnd, start + 1)
+        first = min(tokenIndex(lastStream.offset(start)), len(lastTokens) - 1)
+        last = min(tokenIndex(lastStream.offset(previousEnd - 1)), len(lastTokens) - 1)
+        
+        # Widen that to whole statements, including their neighbours in the same block
+        oldStatements = []
+        for token in lastTokens[first:last + 1]:
+            statement = statementOf(token)
+            if statement == None:
+                return None
+            if len(oldStatements) <= 0 or oldStatements[-1] is not statement:
+                oldStatements.append(statement)
                 
-            ast = ASTRoot(nodes, filepath)
-            self.hub.register(ast)
+        parent = oldStatements[0].parent
+        firstIndex = parent.childIndex(oldStatements[0])
+        for offset in range(0, len(oldStatements)):
+            if oldStatements[offset].parent is not parent:
+                return None
+            if parent.childIndex(oldStatements[offset]) != firstIndex + offset:
+                return None
+        if firstIndex > 0 and not isinstance(parent.children[firstIndex - 1], CodeBlock):
+            firstIndex -= 1
+            oldStatements.insert(0, parent.children[firstIndex])
+        if firstIndex + len(oldStatements) < len(parent.children):
+            if not isinstance(parent.children[firstIndex + len(oldStatements)], CodeBlock):
+                oldStatements.append(parent.children[firstIndex + len(oldStatements)])
+            
+        first = tokenIndex(oldStatements[0].firstLeaf().offset)
+        last = tokenIndex(oldStatements[-1].lastLeaf().offset)
+        if last < len(lastTokens) - 1 and rawIndex(lastTokens[last]) < previousEnd:
+            return None # The last token of the statements was changed, its successor could be too
+        
+        # The same range of (not yet normalized) tokens in the previous and the new stream
+        rawStart = 0
+        if first > 0:
+            rawStart = rawIndex(lastTokens[first - 1]) + 1
+        (rawEnd, newRawEnd) = (len(lastStream), len(stream))
+        if last < len(lastTokens) - 1:
+            rawEnd = rawIndex(lastTokens[last]) + 1
+            newRawEnd = rawEnd + len(stream) - len(lastStream)
             
-            self._parseCache[hash] = (ast, tokens)
-        return self._parseCache[hash]
+        tokens = self.normalize(stream.tokens(rawStart, newRawEnd, SourceBuffer(stream.code)))
+        if len(tokens) <= 0 or not self.isNodeRelevantForGrammar(tokens[-1]):
+            return None
+            
+        newStatements = self.rebuildStatements(oldStatements, lastTokens[first:last + 1], tokens)
+        if newStatements == None or not self.canReplaceStatements(oldStatements, newStatements):
+            return None
+            
+        # Everything was checked, from here on the previous syntax-tree gets changed
+        self._parseCache.pop(lastHash)
+        
+        codeStart = lastStream.offset(rawStart)
+        (codeEnd, newCodeEnd) = (len(lastStream.code), len(stream.code))
+        if rawEnd < len(lastStream):
+            (codeEnd, newCodeEnd) = (lastStream.offset(rawEnd), stream.offset(newRawEnd))
+        newCode = stream.code[codeStart:newCodeEnd]
+        
+        ancestors = []
+        node = parent
+        while node != None:
+            ancestors.append((node, node.codeStart()))
+            node = node.parent
+            
+        parent.replaceChildren(firstIndex, firstIndex + len(oldStatements), newStatements)
+        
+        for (ancestor, ancestorStart) in ancestors:
+            ancestor.replaceCode(codeStart - ancestorStart, codeEnd - ancestorStart, newCode)
+            
+        # All nodes of the syntax-tree share one source-buffer, which now holds the new code
+        source = lastTokens[0].source
+        source.text = stream.code
+        for token in tokens:
+            token.source = source
+            for node in token.prepended:
+                node.source = source
+            for node in token.appended:
+                node.source = source
+            
+        if rawEnd < len(lastStream):
+            offsetDelta = newCodeEnd - codeEnd
+            rowDelta = stream.row(newRawEnd) - lastStream.row(rawEnd)
+            colDelta = stream.col(newRawEnd) - lastStream.col(rawEnd)
+            if offsetDelta != 0 or rowDelta != 0 or colDelta != 0:
+                child = newStatements[-1]
+                for (ancestor, ancestorStart) in ancestors:
+                    for index in range(ancestor.childIndex(child) + 1, len(ancestor.children)):
+                        ancestor.children[index].shiftTree(
+                            offsetDelta, 
+                            rowDelta, 
+                            colDelta, 
+                            lastStream.row(rawEnd)
+                        )
+                    child = ancestor
+            
+        lastAST.row = lastAST.children[0].row
+        lastAST.col = lastAST.children[0].col
+        lastAST.offset = lastAST.children[0].offset
+        lastAST._filepath = filepath
+        lastAST.revision += 1
+        
+        return (lastAST, lastTokens[:first] + tokens + lastTokens[last + 1:])
+        
+    def rebuildStatements(self, oldStatements, oldTokens, newTokens): # list<ASTNode>|None
+        # The old statements with the new tokens in place of the old ones, or None if the
+        # grammar could tell them apart: If they differ in their name or in a code that the
+        # grammar looks at (see grammarKeys).
+        if len(oldTokens) != len(newTokens):
+            return None
+        grammarKeys = self.grammarKeys()
+        for (oldToken, newToken) in zip(oldTokens, newTokens):
+            if type(oldToken) != Token or type(newToken) != Token:
+                return None
+            if oldToken.tokenName != newToken.tokenName:
+                return None
+            if oldToken.code != newToken.code:
+                if oldToken.code in grammarKeys or newToken.code in grammarKeys:
+                    return None
+        
+        tokens = iter(newTokens)
+        def rebuild(node): # ASTNode
+            if type(node) == Token:
+                return next(tokens)
+            return ASTBranch([rebuild(child) for child in node.children], node.type)
+        return [rebuild(statement) for statement in oldStatements]
+        
+    def canReplaceStatements(self, oldStatements, newStatements): # boolean
+        # Whether groupStatementsIntoBlocks would put newStatements in place of oldStatements
+        # without changing any block around them (see _reparse).
+        return True
         
     def _applyGrammar(self, nodes, grammarMap):
+        nodes = NodeList(nodes, self._memoizeMatches)
         nodeMap = self._mapNodes(nodes)
         while len(nodeMap) > 0:
             hasMutated = False
-            for nodeKey in nodeMap.copy().keys():
+            for nodeKey in list(nodeMap.keys()):
                 if nodeKey in grammarMap:
                     
                     if nodeKey not in nodeMap:
                         continue
                 
-                    for node in nodeMap[nodeKey].copy():
+                    for node in list(nodeMap[nodeKey]):
                         for pattern in grammarMap[nodeKey]:
                             
-                            nodeIndex = node.offsetIn(nodes)
-                            if nodeIndex == None:
+                            position = nodes.positionOf(node)
+                            if position == None:
                                 break
                             
-                            if pattern.matches(nodes, nodeIndex):
-                                (replacedNodes, newNodeIndex) = pattern.mutate(nodes, nodeIndex)
+                            if pattern.matches(nodes, position):
+                                (replacedNodes, newNodePosition) = pattern.mutate(nodes, position)
+                                nodes.forgetMatches()
         
                                 for replacedNode in replacedNodes:
                                     hasMutated = True
                                     
                                     replacedNodeKey = replacedNode.grammarKey()
-                                    nodeMap[replacedNodeKey].remove(replacedNode)
+                                    del nodeMap[replacedNodeKey][replacedNode]
                                     if len(nodeMap[replacedNodeKey]) <= 0:
                                         del nodeMap[replacedNodeKey]
                                         
-                                    if replacedNode.code in nodeMap and replacedNode in nodeMap[replacedNode.code]:
-                                        nodeMap[replacedNode.code].remove(replacedNode)
-                                        if len(nodeMap[replacedNode.code]) <= 0:
-                                            del nodeMap[replacedNode.code]
+                                    if type(replacedNode) != Token:
+                                        continue # Only tokens are mapped by their code (see _mapNodes)
+                                    replacedCode = replacedNode.code
+                                    if replacedCode in nodeMap and replacedNode in nodeMap[replacedCode]:
+                                        del nodeMap[replacedCode][replacedNode]
+                                        if len(nodeMap[replacedCode]) <= 0:
+                                            del nodeMap[replacedCode]
                                             
-                                if newNodeIndex != None:
+                                if newNodePosition != None:
                                     hasMutated = True
-                                    newNode = nodes[newNodeIndex]
+                                    newNode = nodes.node(newNodePosition)
                                     newNodeKey = newNode.grammarKey()
                                     if newNodeKey not in nodeMap:
-                                        nodeMap[newNodeKey] = []
-                                    nodeMap[newNodeKey].append(newNode)
+                                        nodeMap[newNodeKey] = {}
+                                    nodeMap[newNodeKey][newNode] = True
                 if nodeKey in nodeMap and len(nodeMap[nodeKey]) <= 0:
                     del nodeMap[nodeKey]
         
             if not hasMutated:
                 break
                 
-        return nodes
+        if self.debugEnabled() and self._memoizeMatches:
+            dumpMatchStats(nodes.matchStats())
+                
+        return list(nodes)
         
     def _mapNodes(self, nodes):
+        # grammar-key or code => ordered set (dict) of nodes, so that nodes can be removed in O(1)
         nodeMap = {}
-        for index in range(0, len(nodes)):
-            token = nodes[index]
+        for token in nodes:
             
             if token.tokenName not in nodeMap:
-                nodeMap[token.tokenName] = []
-            nodeMap[token.tokenName].append(token)
+                nodeMap[token.tokenName] = {}
+            nodeMap[token.tokenName][token] = True
             
             if token.code not in nodeMap:
-                nodeMap[token.code] = []
-            nodeMap[token.code].append(token)
+                nodeMap[token.code] = {}
+            nodeMap[token.code][token] = True
         return nodeMap
     
-    def normalize(self, nodes):
-        index = 0
-        lastRelevantIndex = None # int
-        irrelevantIndexes = [] # list<int>
-        while index < len(nodes):
-            node = nodes[index]
-            if self.isNodeRelevantForGrammar(node):
-                indexShift = 0
-                while len(irrelevantIndexes) > 0:
-                    irrelevantIndex = irrelevantIndexes.pop(0)
-                    irrelevantNode = nodes.pop(irrelevantIndex + indexShift)
-                    index -= 1
-                    indexShift -= 1
-                    node.prepend(irrelevantNode)
-                lastRelevantIndex = index
+    def normalize(self, nodes): # list<ASTNode>
+        # Attaches the nodes that are irrelevant for the grammar (whitespace, comments, ...) to
+        # the next relevant node, those after the last relevant node to that one, in one pass.
+        # The irrelevant nodes in front of a node become its list of prepended nodes as they are.
+        relevantNodes = []
+        irrelevantNodes = []
+        isRelevant = self.isNodeRelevantForGrammar
+        for node in nodes:
+            if isRelevant(node):
+                if len(irrelevantNodes) > 0:
+                    if node.prepended is NO_NODES:
+                        node.prepended = irrelevantNodes
+                    else:
+                        node.prepended.extend(irrelevantNodes)
+                    irrelevantNodes = []
+                relevantNodes.append(node)
             else:
-                irrelevantIndexes.append(index)
+                irrelevantNodes.append(node)
         
-            index += 1
+        if len(relevantNodes) <= 0:
+            return nodes
         
-        if lastRelevantIndex != None and len(irrelevantIndexes) > 0:
-            node = nodes[lastRelevantIndex]
-            indexShift = 0
-            while len(irrelevantIndexes) > 0:
-                irrelevantIndex = irrelevantIndexes.pop(0)
-                irrelevantNode = nodes.pop(irrelevantIndex + indexShift)
-                indexShift -= 1
-                node.append(irrelevantNode)
+        if len(irrelevantNodes) > 0:
+            node = relevantNodes[-1]
+            if node.appended is NO_NODES:
+                node.appended = irrelevantNodes
+            else:
+                node.appended.extend(irrelevantNodes)
         
-        return nodes
+        return relevantNodes
 
-    def lex(self, code, previousTokens):
-        # TODO: re-use data from previousTokens for better performance
+    def lex(self, code, previousTokens, change=None): # TokenStream
+        # The tokens of the previous code are not taken from previousTokens (which only contains
+        # the tokens relevant for the grammar), but from the last code lexed by this language.
         hash = hashlib.md5(code.encode()).hexdigest()
-        if hash not in self._lexCache:
-            tokens = []
-
-            row = 1
-            col = 1
-            offset = 0
-
-            code = code.replace('\r\n', '\n')
-            code = code.replace('\r', '\n')
-
-            matchers = self.tokenMatchers()
-        
-            while len(code) > 0:
-                beforeLength = len(code)
-                for matcher in matchers:
-                    if len(code) <= 0:
-                        break
-
-                    (codeAfter, tokenDef) = matcher.lexNext(code)
-
-                    if tokenDef != None:
-                        assert isinstance(tokenDef, TokenDef)
-                        token = tokenDef.toToken(self, row, col, offset)
-                        assert isinstance(token, Token)
-                        tokens.append(token)
-
-                    processedCode = code[:(len(code) - len(codeAfter))]
-
-                    (offset, row, col) = self._rowAndColForProcessed(processedCode, offset, row, col)
- 
-                    code = codeAfter
-                    if tokenDef != None:
-                        break
-                        
-                if beforeLength == len(code):
-                    tokens.append(Token(
-                        self, 
-                        "T_INVALID",
-                        code[0],
-                        row,
-                        col,
-                        offset
-                    ))
-                    (offset, row, col) = self._rowAndColForProcessed(code[0], offset, row, col)
-                    code = code[1:]
+        tokens = self._lexCache.get(hash)
+        if tokens == None:
+            code = self._normalizeLineEndings(code)
+            
+            if change != None and self._lastLexed != None:
+                tokens = self.lexer().relex(self._lastLexed, code, change)
                     
-            self._lexCache[hash] = tokens
-        return self._lexCache[hash]
-        
-    def _rowAndColForProcessed(self, processedCode, offset, row, col):
-        processedLength = len(processedCode)
-        offset += processedLength
-        row += processedCode.count("\n")
-        if "\n" in processedCode:
-            col = (len(processedCode) - processedCode.rfind("\n"))
-        else:
-            col += processedLength
-        return (offset, row, col)
+            if tokens == None:
+                tokens = self.lexer().lex(code)
+                
+            self._lexCache.set(hash, tokens, len(tokens) * LEXED_BYTES_PER_TOKEN + len(code))
+        self._lastLexed = tokens
+        return tokens
+        
+    def _normalizeLineEndings(self, code):
+        code = code.replace('\r\n', '\n')
+        code = code.replace('\r', '\n')
+        return code
+        
+    def lexer(self): # Lexer
+        if self._lexer == None:
+            self._lexer = Lexer(self, self.tokenMatchers())
+        return self._lexer
         
     def grammarMap(self):
         if self._grammarMap == None:
@@ -250,8 +514,19 @@ class Language: # abstract
                     if not key in self._grammarMap:
                         self._grammarMap[key] = []
                     self._grammarMap[key].append(pattern)
+            if self._grammarProfile != None:
+                self._grammarMap = self._grammarProfile.wrap(self._grammarMap)
         return self._grammarMap
         
+    def grammarKeys(self): # set<string>
+        # Everything the grammar compares nodes with: Their grammar-keys, but also the code of 
+        # tokens, so a token whose code is none of these could have any other such code instead.
+        if self._grammarKeys == None:
+            self._grammarKeys = set(self.grammarMap().keys())
+            for pattern in self.grammar():
+                pattern.collectKeys(self._grammarKeys)
+        return self._grammarKeys
+        
 class AutocompletionType(Enum):
     CLASS = 1
     METHOD = 2
@@ -375,31 +650,171 @@ class FileContext:
         
         
 class LanguageFromSyntaxTreeHighlighter(QSyntaxHighlighter):
+    # Lines of the text-field that are visible get highlighted right away, all other lines in
+    # time-slices of EINSICHT_HIGHLIGHT_SLICE_MS (default 10) while the editor is idle, so the
+    # time until the screen is colored does not depend on the length of the document. Can be
+    # disabled with EINSICHT_LAZY_HIGHLIGHT=0 (highlights all lines at once).
     
     def __init__(self, hub, document, syntaxTree, language):
         super().__init__(document)
         self.hub = hub
         self.syntaxTree = syntaxTree
         self.language = language
+        self._revision = None
+        self._formatRuns = None # FormatRuns of the syntax-tree, created on first use
         self._selection = ""
         self._searchOccurencesByLine = {}
+        self._selectionFormat = QTextCharFormat()
+        self._selectionFormat.setBackground(Qt.yellow)
+        self._lazy = os.environ.get('EINSICHT_LAZY_HIGHLIGHT', '1') == '1'
+        self._sliceSeconds = int(os.environ.get('EINSICHT_HIGHLIGHT_SLICE_MS', 10)) / 1000
+        self._visibleLines = None # (first, last) block-number, while highlighting (see _isVisible)
+        self._highlightingPending = False # True while rehighlighting lines on purpose, not for Qt
+        self._nextPendingLine = None # block-number to continue with, None if all are up to date
+        self._pendingTimer = QTimer(self)
+        self._pendingTimer.setSingleShot(True)
+        self._pendingTimer.timeout.connect(self._highlightPendingLines)
         hub.setup(self)
-        self._reIndexTree()
+        if syntaxTree != None:
+            self._revision = syntaxTree.revision
 
     @on(ASTRoot)
     def updateSyntaxTree(self, a=None):
         syntaxTree = self.hub.get(ASTRoot)
         print(syntaxTree)
-        if self.syntaxTree != syntaxTree:
+        # Incremental parsing changes the previous syntax-tree in place (see Language._reparse)
+        if self.syntaxTree != syntaxTree or self._revision != syntaxTree.revision:
             self.syntaxTree = syntaxTree
-            self._reIndexTree()
-            self.rehighlight()
+            self._revision = syntaxTree.revision
+            self._formatRuns = FormatRuns(syntaxTree, self.language)
+            self._rehighlightChangedLines()
+            
+    def _rehighlightChangedLines(self):
+        # Only the lines whose formats differ from those they were last highlighted with. Lines
+        # that were edited in the meantime got highlighted by Qt right away, with the formats of
+        # the line they had in the previous syntax-tree, so they differ if that was wrong.
+        # Replaces what was left to do for an earlier syntax-tree.
+        document = self.document()
+        if not self._lazy or self._visibleRange() == None:
+            self._nextPendingLine = None
+            self.syntaxTree.positionIndex() # Faster than walking the tree for every line
+            self._rehighlightOutdatedLines(document.begin(), None, None)
+            return
+        self._nextPendingLine = 0
+        self._rehighlightVisibleLines()
+        self._pendingTimer.start(0)
+        
+    def _highlightPendingLines(self):
+        # One time-slice of the lines that are not up to date, the visible ones first: they may
+        # have been scrolled into view in the meantime.
+        if self.syntaxTree == None or self._nextPendingLine == None:
+            return
+        deadline = time.perf_counter() + self._sliceSeconds
+        self._rehighlightVisibleLines()
+        block = self.document().findBlockByNumber(self._nextPendingLine)
+        block = self._rehighlightOutdatedLines(block, None, deadline)
+        if block.isValid():
+            self._nextPendingLine = block.blockNumber()
+            self._pendingTimer.start(0)
+        else:
+            self._nextPendingLine = None
+            
+    def _rehighlightVisibleLines(self):
+        visibleLines = self._visibleRange()
+        if visibleLines != None:
+            (first, last) = visibleLines
+            self._rehighlightOutdatedLines(self.document().findBlockByNumber(first), last + 1, None)
             
+    def _rehighlightOutdatedLines(self, block, end, deadline): # QTextBlock where it stopped
+        # From block up to the block-number end (None: the last block) or until the deadline
+        if self.syntaxTree == None:
+            return self.document().lastBlock().next()
+        self._highlightingPending = True
+        try:
+            while block.isValid() and (end == None or block.blockNumber() < end):
+                highlighted = block.userData()
+                if highlighted == None or highlighted.runs != self._runsOfBlock(block):
+                    self.rehighlightBlock(block)
+                block = block.next()
+                if deadline != None and time.perf_counter() > deadline:
+                    break
+        finally:
+            self._highlightingPending = False
+        return block
+            
+    def _runsOfBlock(self, block): # list<(column, length, QTextCharFormat)>|NO_RUNS
+        if self._formatRuns == None:
+            self._formatRuns = FormatRuns(self.syntaxTree, self.language)
+        start = block.position()
+        end = start + block.length() - 1 # Without the line-break
+        if not self._formatRuns.hasRuns(start, end):
+            # The following lines are usually highlighted next
+            lines = []
+            nextBlock = block
+            while nextBlock.isValid() and len(lines) < PREFETCHED_LINES:
+                nextStart = nextBlock.position()
+                lines.append((nextStart, nextStart + nextBlock.length() - 1))
+                nextBlock = nextBlock.next()
+            self._formatRuns.createRuns(lines)
+        return self._formatRuns.runsOnLine(start, end)
+        
+    def _visibleRange(self): # (first, last) block-number|None if there is no text-field
+        if not self.hub.has(TextField):
+            return None
+        textField = self.hub.get(TextField)
+        if textField.document() is not self.document():
+            return None
+        block = textField.firstVisibleBlock()
+        if not block.isValid():
+            return None
+        lineHeight = max(1, textField.fontMetrics().lineSpacing())
+        lines = textField.viewport().height() // lineHeight + 1
+        return (block.blockNumber(), block.blockNumber() + lines)
+        
+    def _isVisible(self, block): # boolean
+        # Qt highlights many lines at once when the content changes, the visible range is only
+        # looked up once for all of them. Without a text-field, all lines count as visible.
+        if self._visibleLines == None:
+            self._visibleLines = self._visibleRange() or (0, sys.maxsize)
+            QTimer.singleShot(0, self._forgetVisibleLines)
+        (first, last) = self._visibleLines
+        return first <= block.blockNumber() <= last
+        
+    def _forgetVisibleLines(self):
+        self._visibleLines = None
+        
     @on(TextField.onSelectionChanged)
     def updateSelection(self, selection):
+        # Only the lines that contain the previous or the new selection, both are found in one
+        # scan of the code each. Selections of more than one line are not highlighted.
+        if "\u2029" in selection or "\n" in selection:
+            selection = ""
         if self._selection != selection:
+            text = self.document().toPlainText()
+            lines = set(linesContaining(text, self._selection))
+            lines.update(linesContaining(text, selection))
             self._selection = selection
-            self.rehighlight()
+            self._rehighlightLines(lines)
+            
+    def _rehighlightLines(self, lines):
+        # The visible ones right away, the others are marked as outdated and left for later (see
+        # _highlightPendingLines), like lines that Qt asked for while they were not visible.
+        document = self.document()
+        visibleLines = self._visibleRange() if self._lazy and self.syntaxTree != None else None
+        self._highlightingPending = True
+        try:
+            for line in sorted(lines):
+                block = document.findBlockByLineNumber(line - 1)
+                if visibleLines == None or visibleLines[0] <= block.blockNumber() <= visibleLines[1]:
+                    self.rehighlightBlock(block)
+                    continue
+                block.setUserData(HighlightedRuns(None))
+                if self._nextPendingLine == None or self._nextPendingLine > block.blockNumber():
+                    self._nextPendingLine = block.blockNumber()
+                if not self._pendingTimer.isActive():
+                    self._pendingTimer.start(0)
+        finally:
+            self._highlightingPending = False
 
     @on(InFileSearchResult)
     def updateInlineSearchResults(self):
@@ -415,30 +830,34 @@ class LanguageFromSyntaxTreeHighlighter(QSyntaxHighlighter):
             self._searchOccurencesByLine[entry.line].append(entry)
             linesToUpdate.append(entry.line)
             
-        document = self.document()
-        for line in set(linesToUpdate):
-            Log.debug("rehighlightBlock " + str(line))
-            self.rehighlightBlock(document.findBlockByLineNumber(line - 1))
+        self._rehighlightLines(set(linesToUpdate))
         
     def highlightBlock(self, text):
         block = self.currentBlock()
         line = block.firstLineNumber() + 1
         self._line = line
         
-        if line in self._nodesByLine:
-            for node in self._nodesByLine[line]:
-                format = self.language.formatForNode(node)
-                if format != None:
-                    self.setFormat(node.col - 1, len(node.code), format)
+        if self.syntaxTree == None:
+            runs = NO_RUNS
+        elif self._lazy and not self._highlightingPending and not self._isVisible(block):
+            # Left for later (see _highlightPendingLines), when the editor is idle
+            runs = None
+            if self._nextPendingLine == None or self._nextPendingLine > block.blockNumber():
+                self._nextPendingLine = block.blockNumber()
+            if not self._pendingTimer.isActive():
+                self._pendingTimer.start(0)
+        else:
+            runs = self._runsOfBlock(block)
+            for (column, length, format) in runs:
+                self.setFormat(column, length, format)
+        self.setCurrentBlockUserData(HighlightedRuns(runs))
         
         if len(self._selection) > 0:
-            format = QTextCharFormat()
-            format.setBackground(Qt.yellow)
             offset = 0
             while True:
                 pos = text.find(self._selection, offset)
                 if pos >= 0:
-                    self.setFormat(pos, len(self._selection), format)
+                    self.setFormat(pos, len(self._selection), self._selectionFormat)
                     offset = pos + len(self._selection)
                 else:
                     break
@@ -449,29 +868,129 @@ class LanguageFromSyntaxTreeHighlighter(QSyntaxHighlighter):
             for occurence in self._searchOccurencesByLine[line]:
                 Log.debug("setFormat L" + str(line) + ":" + str(occurence.column))
                 self.setFormat(occurence.column, len(occurence.text), format)
+        
 
-    def _reIndexTree(self):
-        self._nodesByLine = {}
-        self._reIndexNode(self.syntaxTree)
+class FormatRuns:
+    # The formats of one syntax-tree per line, as (column, length, QTextCharFormat) in the order
+    # in which they are applied: tokens first, then the branches that have a format (f.e. the
+    # identifier of a call), inner branches before the ones around them, so that each node
+    # overrides the formats of the nodes in it. A node that spans several lines gets a run on
+    # each of them. Lines are given by the offsets of their first character and of the
+    # character right after their last one. The runs of a line are created when they are first
+    # asked for and then kept, so that highlighting a line again does not ask the language
+    # again and lines that are never highlighted are never looked at.
+    
+    def __init__(self, syntaxTree, language):
+        self.syntaxTree = syntaxTree
+        self.language = language
+        self.revision = syntaxTree.revision
+        self._runsByLine = {} # (start, end) => list<(column, length, QTextCharFormat)>|NO_RUNS
+        
+    def hasRuns(self, start, end): # boolean
+        return (start, end) in self._runsByLine
+        
+    def runsOnLine(self, start, end): # list<(column, length, QTextCharFormat)>|NO_RUNS
+        runs = self._runsByLine.get((start, end))
+        if runs == None:
+            self.createRuns([(start, end)])
+            runs = self._runsByLine[(start, end)]
+        return runs
+        
+    def createRuns(self, lines):
+        # lines: list<(start, end)> of consecutive lines, which are looked up in the syntax-tree
+        # all at once
+        (start, end) = (lines[0][0], lines[-1][1])
+        starts = [lineStart for (lineStart, lineEnd) in lines]
+        runsOfLines = [NO_RUNS] * len(lines)
+        language = self.language
+        depths = {} # id(branch) => depth in the tree, of the branches above the tokens
+        branches = [] # (depth, branch, QTextCharFormat) of the branches with a format
+        for token in self.syntaxTree.tokensBetween(start, end):
+            format = language.formatForNode(token)
+            if format != None:
+                addRuns(lines, starts, runsOfLines, token.offset, token.offset + token.codeLength(), format)
+                
+            # The branches above the token, up to the first one that was already looked at
+            ancestors = []
+            node = token.parent
+            while node != None and id(node) not in depths:
+                ancestors.append(node)
+                node = node.parent
+            depth = depths[id(node)] if node != None else -1
+            for branch in reversed(ancestors):
+                depth += 1
+                depths[id(branch)] = depth
+                format = language.formatForNode(branch)
+                if format != None and branch.offset < end and start < branch.codeEnd():
+                    branches.append((depth, branch, format))
+                    
+        branches.sort(key=lambda entry: -entry[0])
+        for (depth, branch, format) in branches:
+            addRuns(lines, starts, runsOfLines, branch.offset, branch.codeEnd(), format)
+        for index in range(0, len(lines)):
+            self._runsByLine[lines[index]] = runsOfLines[index]
         
-    def _reIndexNode(self, node):
-        if node == None:
-            return
-            
-        for predecessor in node.prepended:
-            self._reIndexNode(predecessor)
+NO_RUNS = ()
 
-        for successor in node.appended:
-            self._reIndexNode(successor)
+class HighlightedRuns(QTextBlockUserData):
+    # The format runs that a block was last highlighted with (see FormatRuns)
+    
+    def __init__(self, runs):
+        super().__init__()
+        self.runs = runs
 
-        for child in node.children:
-            self._reIndexNode(child)
+def addRuns(lines, starts, runsOfLines, nodeStart, nodeEnd, format):
+    # A run for each of the lines (see FormatRuns.createRuns) that the code from nodeStart to
+    # nodeEnd is on
+    index = max(0, bisect.bisect_right(starts, nodeStart) - 1)
+    while index < len(lines) and lines[index][0] < nodeEnd:
+        (start, end) = lines[index]
+        runStart = max(nodeStart, start)
+        runEnd = min(nodeEnd, end)
+        if runStart < runEnd:
+            if runsOfLines[index] is NO_RUNS:
+                runsOfLines[index] = []
+            runsOfLines[index].append((runStart - start, runEnd - runStart, format))
+        index += 1
 
-        for line in range(node.row, node.lastRow() + 1):
-            if line not in self._nodesByLine:
-                self._nodesByLine[line] = []
-            self._nodesByLine[line].append(node)
-        
+def linesContaining(text, fragment): # list<int>
+    # The numbers (starting at 1) of the lines of text that contain fragment (without line-breaks)
+    lines = []
+    if len(fragment) <= 0:
+        return lines
+    line = 1
+    lineStart = 0
+    position = text.find(fragment)
+    while position >= 0:
+        line += text.count("\n", lineStart, position)
+        lines.append(line)
+        lineEnd = text.find("\n", position + len(fragment))
+        if lineEnd < 0:
+            break
+        line += 1
+        lineStart = lineEnd + 1
+        position = text.find(fragment, lineStart)
+    return lines
+
+def statementOf(node): # ASTNode|None
+    # The top-level node (directly in a code-block or the root) that contains the given node
+    while not isinstance(node.parent, (CodeBlock, ASTRoot)):
+        if node.parent == None:
+            return None
+        node = node.parent
+    return node
+
+def dumpMatchStats(stats):
+    # Prints how often the memoized match of each pattern could be re-used
+    for pattern in sorted(stats, key=lambda pattern: -sum(stats[pattern])):
+        (hits, misses) = stats[pattern]
+        print(
+            (type(pattern).__name__ + ":" + pattern.producedNodeKey()).ljust(40),
+            "hits:", str(hits).rjust(7),
+            "misses:", str(misses).rjust(7),
+            "hit-rate: %.1f%%" % (100 * hits / max(1, hits + misses))
+        )
+    print("\n")
 
 def dumpAST(nodes, level=0, depth=None):
     if depth != None and level + 1 > depth:
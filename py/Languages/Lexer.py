@@ -0,0 +1,170 @@
+import re, bisect
+
+from .Tokens import TokenMatcher, CompiledTokenMatcher
+from .TokenStream import TokenStream, TokenTypes
+
+class Lexer:
+    # Turns code into tokens using the token-matchers of a language.
+    #
+    # The matchers are tried in order at the current position, the first one that produces a
+    # token wins. Runs of matchers that can be expressed as regular expressions are compiled
+    # into one CompiledTokenMatcher, so that most tokens need only a single regex-match.
+    # The code is never sliced, which keeps lexing linear in the size of the code.
+
+    def __init__(self, language, matchers):
+        self._language = language
+        self._matchers = self._compile(matchers)
+        self._tokenTypes = TokenTypes()
+        
+    def matchers(self): # list<TokenMatcher>
+        return self._matchers
+        
+    def tokenTypes(self): # TokenTypes
+        return self._tokenTypes
+        
+    def lex(self, code): # TokenStream
+        tokens = TokenStream(self._language, code, self._tokenTypes)
+        self._lexFrom(code, tokens, 0, 1, 1)
+        return tokens
+        
+    def relex(self, previousTokens, code, change): # TokenStream|None
+        # Re-uses the tokens of the previous code for code, which is the previous code with one 
+        # change applied (as reported by QTextDocument.contentsChange). Only the code around the 
+        # change gets lexed again, until the new tokens line up with the previous ones. The 
+        # previous tokens after that point are copied, moved to their new position.
+        #
+        # Returns None if the change does not describe the difference between both codes.
+        (position, removed, added) = change
+        delta = added - removed
+        previousCode = previousTokens.code
+        
+        if position < 0 or len(code) != len(previousCode) + delta:
+            return None
+        if code[:position] != previousCode[:position]:
+            return None
+        if code[position + added:] != previousCode[position + removed:]:
+            return None
+            
+        # Matchers may look a bit beyond the code they consume (f.e.: a keyword must not be 
+        # followed by an identifier-character), so lexing restarts one token before the line 
+        # of the change. It must also start at a position where lexing had started before.
+        previousOffsets = previousTokens.offsets()
+        lineStart = code.rfind("\n", 0, position) + 1
+        index = bisect.bisect_right(previousOffsets, lineStart) - 2
+        while index > 0 and not self._isContiguous(previousTokens, index):
+            index -= 1
+            
+        if index > 0:
+            restart = previousTokens.offset(index)
+            row = previousTokens.row(index)
+            col = previousTokens.col(index)
+        else:
+            (index, restart, row, col) = (0, 0, 1, 1)
+            
+        resyncIndex = len(previousTokens)
+        def canResync(newPosition): # boolean
+            nonlocal resyncIndex
+            previousPosition = newPosition - delta
+            candidate = bisect.bisect_left(previousOffsets, previousPosition)
+            if candidate < len(previousTokens) and candidate > 0:
+                if previousTokens.offset(candidate) == previousPosition:
+                    if self._isContiguous(previousTokens, candidate):
+                        resyncIndex = candidate
+                        return True
+            return False
+            
+        tokens = TokenStream(self._language, code, self._tokenTypes)
+        tokens.extend(previousTokens, 0, index)
+            
+        (newPosition, row, col) = self._lexFrom(
+            code, 
+            tokens,
+            restart, 
+            row, 
+            col, 
+            position + added, 
+            canResync
+        )
+        
+        tokens.relexed = (previousTokens.id, index, len(tokens), resyncIndex)
+        
+        if resyncIndex < len(previousTokens):
+            tokens.extend(
+                previousTokens, 
+                resyncIndex, 
+                len(previousTokens), 
+                delta,
+                row - previousTokens.row(resyncIndex),
+                col - previousTokens.col(resyncIndex)
+            )
+        
+        return tokens
+        
+    def _lexFrom(self, code, tokens, position, row, col, resyncFrom=None, canResync=None):
+        # return: (position, row, col)
+        matchers = self._matchers
+        length = len(code)
+        
+        while position < length:
+            if resyncFrom != None and position >= resyncFrom and canResync(position):
+                break
+                
+            startPosition = position
+            for matcher in matchers:
+                if position >= length:
+                    break
+                    
+                (end, tokenDef) = matcher.matchAt(code, position)
+                
+                if tokenDef != None:
+                    tokens.append(tokenDef.tokenName, tokenDef.code, row, col, position)
+                    
+                newLines = code.count("\n", position, end)
+                if newLines > 0:
+                    row += newLines
+                    col = end - code.rfind("\n", position, end)
+                else:
+                    col += end - position
+                position = end
+                
+                if tokenDef != None:
+                    break
+                    
+            if position == startPosition:
+                tokens.append("T_INVALID", code[position], row, col, position)
+                if code[position] == "\n":
+                    row += 1
+                    col = 1
+                else:
+                    col += 1
+                position += 1
+                
+        return (position, row, col)
+        
+    def _isContiguous(self, tokens, index): # boolean
+        # True if the token at index starts where the token before it ended, which means that
+        # lexing (re-)started at the offset of this token.
+        return tokens.offset(index - 1) + tokens.length(index - 1) == tokens.offset(index)
+        
+    def _compile(self, matchers): # list<TokenMatcher>
+        compiled = []
+        combinable = []
+        for matcher in matchers:
+            assert isinstance(matcher, TokenMatcher)
+            if matcher.pattern() != None:
+                combinable.append(matcher)
+            else:
+                compiled += self._combine(combinable)
+                compiled.append(matcher)
+                combinable = []
+        compiled += self._combine(combinable)
+        return compiled
+        
+    def _combine(self, matchers): # list<TokenMatcher>
+        if len(matchers) <= 0:
+            return []
+        try:
+            return [CompiledTokenMatcher(matchers)]
+        except re.error:
+            # F.e.: two patterns using the same group-name, or global flags in a pattern
+            return matchers
@@ -28,7 +28,7 @@ class MarkdownLanguage(Language):
         return [
         ]
         
-    def formatForNode(self, node):
+    def createFormat(self, node):
         return None
 
         
@@ -0,0 +1,104 @@
+class NodeListEntry:
+    # One position in a NodeList. The node at a position can be replaced without the position
+    # (or any position after it) changing, just like with the index of a list.
+    __slots__ = ('node', 'next')
+
+    def __init__(self, node):
+        self.node = node
+        self.next = None
+
+class NodeList:
+    # The nodes that the grammar gets applied to, as a linked list of positions (NodeListEntry).
+    # Combining nodes into a new node does not move the positions behind them, and each node
+    # knows its own position, so neither needs the linear search or shifting that a python
+    # list would need for each mutation.
+
+    def __init__(self, nodes, memoize=False):
+        self._first = None
+        self._positions = {} # ASTNode => NodeListEntry
+        
+        # Packrat memo: results of NodePattern.matchSpan, kept until the nodes they looked at
+        # change (see forgetMatches). None if memoization is disabled.
+        self._matches = {} if memoize else None # NodeListEntry => dict(NodePattern => span)
+        self._matchStats = {} # NodePattern => [hits, misses]
+        previous = None
+        for node in nodes:
+            entry = NodeListEntry(node)
+            self._positions[node] = entry
+            if previous == None:
+                self._first = entry
+            else:
+                previous.next = entry
+            previous = entry
+
+    def first(self): # NodeListEntry|None
+        return self._first
+
+    def node(self, position): # ASTNode
+        return position.node
+
+    def next(self, position): # NodeListEntry|None
+        return position.next
+
+    def positionOf(self, node): # NodeListEntry|None
+        # None if the node is not (anymore) part of this list
+        return self._positions.get(node)
+
+    def replace(self, position, node):
+        del self._positions[position.node]
+        self._positions[node] = position
+        position.node = node
+        if self._matches != None:
+            self._matches.pop(position, None)
+
+    def removeAfter(self, start, end):
+        # Removes all positions after start, up to and including end
+        if start is end:
+            return
+        entry = start.next
+        while entry != None:
+            del self._positions[entry.node]
+            if self._matches != None:
+                self._matches.pop(entry, None)
+            if entry is end:
+                break
+            entry = entry.next
+        start.next = end.next
+
+    def matchSpan(self, pattern, position, matcher): # return (boolean, NodeListEntry|None)
+        # Returns the (memoized) result of matcher(self, position), which is the actual
+        # matchSpan implementation of the given pattern.
+        if self._matches == None:
+            return matcher(self, position)
+        if pattern not in self._matchStats:
+            self._matchStats[pattern] = [0, 0]
+        if position in self._matches and pattern in self._matches[position]:
+            self._matchStats[pattern][0] += 1
+            return self._matches[position][pattern]
+        self._matchStats[pattern][1] += 1
+        span = matcher(self, position)
+        if position not in self._matches:
+            self._matches[position] = {}
+        self._matches[position][pattern] = span
+        return span
+
+    def forgetMatches(self):
+        # Must be called after nodes were mutated: a pattern looks at the nodes after its
+        # position, so a mutation also affects memoized matches in front of the mutated nodes.
+        # While a mutation is in progress, patterns only move forward and never ask about
+        # positions in front of it again, so until then it is enough to forget the matches
+        # at the mutated positions themselves (see replace, removeAfter).
+        if self._matches != None:
+            self._matches.clear()
+
+    def matchStats(self): # dict(NodePattern => (hits, misses))
+        stats = {}
+        for pattern in self._matchStats:
+            stats[pattern] = tuple(self._matchStats[pattern])
+        return stats
+
+    def __iter__(self):
+        entry = self._first
+        while entry != None:
+            yield entry.node
+            entry = entry.next
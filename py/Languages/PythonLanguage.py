@@ -218,10 +218,35 @@ class PythonLanguage(Language):
             stack[-1].addStatement(block)
         return stack[0].children
         
+    def canReplaceStatements(self, oldStatements, newStatements): # boolean
+        # groupStatementsIntoBlocks only looks at the indentations in front of the statements:
+        # If the new statements have the same ones as the old statements, it would neither open
+        # nor close a block around them any differently.
+        if len(oldStatements) != len(newStatements):
+            return False
+        for (oldStatement, newStatement) in zip(oldStatements, newStatements):
+            oldLevels = [node.code.count(" ") for node in oldStatement.findInPrepended("T_INDENTATION")]
+            newLevels = [node.code.count(" ") for node in newStatement.findInPrepended("T_INDENTATION")]
+            if oldLevels != newLevels:
+                return False
+                
+        block = oldStatements[0].parent
+        if isinstance(block, CodeBlock) and block.children[0] is oldStatements[0]:
+            # The block starts at the indentation of its first statement
+            indentationNode = next(newStatements[0].findInPrepended("T_INDENTATION"), None)
+            if indentationNode == None or indentationNode.offset != block.offset:
+                return False
+        return True
+        
     def stylesheet(self):
         return CssAsAstStylesheet(os.path.dirname(__file__) + "/python.css")
 
-    def formatForNode(self, node):
+    def codeClass(self, node): # string|None
+        if type(node) == Token and node.tokenName == "T_SYMBOL" and node.code in ["self", "super"]:
+            return node.code
+        return None
+
+    def createFormat(self, node):
         if type(node) == Token: 
             format = QTextCharFormat()
 
@@ -294,7 +319,7 @@ class PythonLanguage(Language):
         for classNode in context.syntaxTree.find("class"):
             classBlock = classNode.next()
             classDef = ClassDef(
-                classNode.find("identifier")[0].code, 
+                next(classNode.find("identifier")).code, 
                 namespace = pythonPath,
                 parents=list(map(lambda a: a.code, classNode.find("tuple-element"))),
                 position=PositionDef.fromNode(classNode),
@@ -2,17 +2,35 @@
 from .AbstractSyntaxTree import ASTNode, ASTBranch
 from .ASTPatterns import NodePattern
 
-class CodeBlock(ASTNode):
+class CodeBlock(ASTBranch):
+    # Starts out empty, unlike other branches, so the position is given instead of taken from
+    # the first child.
+    __slots__ = ()
+
     def __init__(self, language, row, col, offset):
-        super().__init__(language, "", row, col, offset, "block")
+        ASTNode.__init__(self, language, row, col, offset, "block")
+        self.children = []
         self._childToIndex = {}
+        self._length = 0
 
     def addStatement(self, statement):
         assert isinstance(statement, ASTNode)
         self._childToIndex[statement] = len(self.children)
         self.children.append(statement)
         statement.parent = self
-        self.code += statement.reconstructCode()
+        self._length += statement.codeEnd() - statement.codeStart()
+        
+    def replaceChildren(self, start, end, children):
+        # Replaces the statements [start:end] with the given ones. Does not change the code.
+        self.children[start:end] = children
+        for child in children:
+            child.parent = self
+        self._childToIndex = {}
+        for index in range(0, len(self.children)):
+            self._childToIndex[self.children[index]] = index
+            
+    def childIndex(self, child): # int
+        return self._childToIndex[child]
         
     def nextChild(self, previous):
         if previous in self._childToIndex:
@@ -32,15 +50,18 @@ class CodeBlock(ASTNode):
     #    pass
 
 class ImportNode(ASTNode):
+    __slots__ = ('code', 'source', '_resource', '_alias')
+
     def __init__(self, node, resource, alias):
         super().__init__(
             node.language, 
-            node.code, 
             node.row, 
             node.col, 
             node.offset, 
             node.type
         )
+        self.code = node.code
+        self.source = node.firstCodeNode().source
         self._resource = resource
         self._alias = alias
         
@@ -0,0 +1,175 @@
+import sys, itertools
+from array import array
+
+from .Tokens import Token
+
+class TokenTypes:
+    # Maps token-names to small integer ids and back. Shared by all streams of one lexer.
+    def __init__(self):
+        self._names = []
+        self._ids = {}
+        
+    def idFor(self, tokenName): # int
+        if tokenName not in self._ids:
+            self._ids[tokenName] = len(self._names)
+            self._names.append(tokenName)
+        return self._ids[tokenName]
+        
+    def name(self, id): # string
+        return self._names[id]
+        
+    def names(self): # list<string>, indexed by id
+        return list(self._names)
+
+class TokenStream:
+    # The tokens of a lexed code, stored column-wise in compact arrays instead of as one Token
+    # object per token. A Token object is only created when a token is accessed (f.e. by the
+    # grammar) and is not kept by the stream: accessing the same index twice creates two tokens.
+
+    _ids = itertools.count()
+
+    def __init__(self, language, code, tokenTypes):
+        self.language = language
+        self.code = code
+        self._tokenTypes = tokenTypes
+        self._types = array('H')
+        self._offsets = array('I')
+        self._lengths = array('I')
+        self._rows = array('I')
+        self._cols = array('I')
+        self._codes = {} # index => string, for tokens whose code differs from the lexed code
+        
+        self.id = next(TokenStream._ids)
+        
+        # Set by Lexer.relex: (previousId, start, end, previousEnd) the tokens [start:end] of this
+        # stream were lexed again and replace the tokens [start:previousEnd] of the stream with 
+        # the id previousId. All other tokens were taken from that previous stream.
+        self.relexed = None
+        
+    def append(self, tokenName, code, row, col, offset):
+        if not self.code.startswith(code, offset):
+            self._codes[len(self._types)] = code # f.e.: keywords in a different case
+        self._types.append(self._tokenTypes.idFor(tokenName))
+        self._offsets.append(offset)
+        self._lengths.append(len(code))
+        self._rows.append(row)
+        self._cols.append(col)
+        
+    def extend(self, other, start, end, offsetDelta=0, rowDelta=0, colDelta=0):
+        # Appends the tokens [start:end] of another stream (of the same lexer), moved by the
+        # given deltas. The colDelta only applies to the tokens on the row of the first token.
+        if start >= end:
+            return
+        
+        offsets = other._offsets[start:end]
+        rows = other._rows[start:end]
+        cols = other._cols[start:end]
+        
+        if offsetDelta != 0:
+            offsets = array('I', [offset + offsetDelta for offset in offsets])
+        
+        if colDelta != 0:
+            index = 0
+            while index < len(rows) and rows[index] == rows[0]:
+                cols[index] += colDelta
+                index += 1
+                
+        if rowDelta != 0:
+            rows = array('I', [row + rowDelta for row in rows])
+            
+        for (index, code) in other._codes.items():
+            if index >= start and index < end:
+                self._codes[len(self._types) + index - start] = code
+        
+        self._types.extend(other._types[start:end])
+        self._offsets.extend(offsets)
+        self._lengths.extend(other._lengths[start:end])
+        self._rows.extend(rows)
+        self._cols.extend(cols)
+        
+    def token(self, index, source=None): # Token
+        # source: SourceBuffer (of self.code) for the syntax-tree that the token will be part of
+        if index < 0:
+            index += len(self._types)
+        return Token(
+            self.language,
+            self._tokenTypes.name(self._types[index]),
+            self.tokenCode(index),
+            self._rows[index],
+            self._cols[index],
+            self._offsets[index],
+            source
+        )
+        
+    def tokens(self, start, end, source=None): # list<Token>
+        return [self.token(index, source) for index in range(start, end)]
+        
+    def tokenName(self, index): # string
+        return self._tokenTypes.name(self._types[index])
+        
+    def tokenCode(self, index): # string
+        if index in self._codes:
+            return self._codes[index]
+        offset = self._offsets[index]
+        # Interned, so that repeated identifiers share one string
+        return sys.intern(self.code[offset:offset + self._lengths[index]])
+        
+    def offset(self, index): # int
+        return self._offsets[index]
+        
+    def length(self, index): # int
+        return self._lengths[index]
+        
+    def row(self, index): # int
+        return self._rows[index]
+        
+    def col(self, index): # int
+        return self._cols[index]
+        
+    def offsets(self): # array<int>, sorted; to be used with bisect, do not modify
+        return self._offsets
+        
+    def serialize(self): # tuple, of values that the marshal module can write
+        return (
+            self._tokenTypes.names(),
+            self._types.tobytes(),
+            self._offsets.tobytes(),
+            self._lengths.tobytes(),
+            self._rows.tobytes(),
+            self._cols.tobytes(),
+            self._codes
+        )
+        
+    @staticmethod
+    def deserialize(language, code, tokenTypes, data): # TokenStream
+        # The stream that was serialized for the same code, possibly by another lexer: the ids
+        # of the token-names are translated to those of the given token-types.
+        (names, types, offsets, lengths, rows, cols, codes) = data
+        stream = TokenStream(language, code, tokenTypes)
+        stream._types.frombytes(types)
+        stream._offsets.frombytes(offsets)
+        stream._lengths.frombytes(lengths)
+        stream._rows.frombytes(rows)
+        stream._cols.frombytes(cols)
+        stream._codes = codes
+        ids = [tokenTypes.idFor(name) for name in names]
+        if ids != list(range(0, len(ids))):
+            stream._types = array('H', [ids[id] for id in stream._types])
+        if not len(stream._offsets) == len(stream._lengths) == len(stream._rows) == \
+            len(stream._cols) == len(stream._types):
+            raise ValueError("Token-stream columns differ in length")
+        return stream
+        
+    def __len__(self):
+        return len(self._types)
+        
+    def __getitem__(self, index): # Token|list<Token>
+        if isinstance(index, slice):
+            return [self.token(subIndex) for subIndex in range(*index.indices(len(self)))]
+        if index >= len(self._types) or index < -len(self._types):
+            raise IndexError("token index out of range")
+        return self.token(index)
+        
+    def __iter__(self):
+        for index in range(0, len(self._types)):
+            yield self.token(index)
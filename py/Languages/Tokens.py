@@ -7,8 +7,12 @@ from .ASTPatterns import NodePattern
 ### TOKENS
 
 class Token(ASTNode):
-    def __init__(self, language, tokenName, code, row, col, offset):
-        super().__init__(language, code, row, col, offset, "token")
+    __slots__ = ('code', 'source', 'tokenName')
+
+    def __init__(self, language, tokenName, code, row, col, offset, source=None):
+        super().__init__(language, row, col, offset, "token")
+        self.code = code
+        self.source = source # SourceBuffer, needed for the code of the branches around this token
         self.tokenName = tokenName
         
     def __repr__(self):
@@ -21,6 +25,28 @@ class TokenMatcher:
     def lexNext(self, text): # return: (text, TokenDef|null)
         raise NotImplementedError
         
+    def matchAt(self, text, position): # return: (position, TokenDef|None)
+        # Position-based variant of lexNext: does not slice the text and returns the offset
+        # right after the consumed code. Matchers that only implement lexNext still work,
+        # but make lexing quadratic again because of the slicing done here.
+        (textAfter, tokenDef) = self.lexNext(text[position:])
+        return (len(text) - len(textAfter), tokenDef)
+        
+    def pattern(self): # return: string|None
+        # Regular expression that matches exactly the code that matchAt would consume.
+        # Used to compile all matchers of a language into one scanner (see Lexer).
+        # None if this matcher cannot be expressed as a regular expression.
+        return None
+        
+    def fallbackPattern(self): # return: string|None
+        # Zero-width regular expression for positions at which pattern() may disagree
+        # with matchAt. At these positions the lexer falls back to calling matchAt.
+        return None
+        
+    def tokenDefForMatch(self, code: str): # return: TokenDef
+        # Builds the TokenDef for code that was matched by pattern()
+        raise NotImplementedError
+        
     def mutateToken(self, token: Token, newCode: str) -> Token:
         raise NotImplementedError
         
@@ -45,17 +71,52 @@ class TokenDef:
 class KeywordsTokenMatcher(TokenMatcher):
     def __init__(self, keywords):
         self._keywords = keywords
+        self._keywordsByUpper = {}
+        for keyword in reversed(keywords):
+            self._keywordsByUpper[keyword.upper()] = keyword
 
     def lexNext(self, text): # return: (text, TokenDef|None)
+        (position, token) = self.matchAt(text, 0)
+        return (text[position:], token)
+        
+    def matchAt(self, text, position): # return: (position, TokenDef|None)
         token = None
         for keyword in self._keywords:
-            if text[0:len(keyword)].upper() == keyword.upper():
-                if not text[len(keyword):len(keyword)+1].isidentifier():
+            end = position + len(keyword)
+            if text[position:end].upper() == keyword.upper():
+                if not text[end:end+1].isidentifier():
                     tokenName = "T_" + keyword.upper()
                     token = TokenDef(tokenName, keyword, self)
-                    text = text[len(keyword):]
-            
-        return (text, token)
+                    position = min(end, len(text))
+        return (position, token)
+        
+    def pattern(self): # return: string|None
+        for keyword in self._keywords:
+            if re.fullmatch(r'[a-zA-Z_][a-zA-Z0-9_]*', keyword) == None:
+                return None
+        if len(self._keywords) <= 0:
+            return None
+        return r'(?ai:' + "|".join(self._keywords) + r')(?![a-zA-Z_])'
+        
+    def fallbackPattern(self): # return: string|None
+        if self.pattern() == None:
+            return None
+        # str.upper() and str.isidentifier() know about all of unicode (f.e.: "ſ".upper() == "S"),
+        # the ASCII-only pattern above is only exact if the keyword and the following character
+        # are ASCII.
+        firstChars = set()
+        for keyword in self._keywords:
+            firstChars.add(keyword[0].upper())
+            firstChars.add(keyword[0].lower())
+        maxLength = max(map(len, self._keywords))
+        return r'(?=[^\x00-\x7f]|[%s][\x00-\x7f]{0,%d}[^\x00-\x7f])' % (
+            re.escape("".join(sorted(firstChars))),
+            maxLength - 1
+        )
+        
+    def tokenDefForMatch(self, code: str): # return: TokenDef
+        keyword = self._keywordsByUpper[code.upper()]
+        return TokenDef("T_" + keyword.upper(), keyword, self)
 
 class LiteralTokenMatcher(TokenMatcher):
     def __init__(self, delimitter, tokenName):
@@ -63,33 +124,70 @@ class LiteralTokenMatcher(TokenMatcher):
         self._tokenName = tokenName
 
     def lexNext(self, text): # return: (text, TokenDef|None)
+        (position, token) = self.matchAt(text, 0)
+        return (text[position:], token)
+        
+    def matchAt(self, text, position): # return: (position, TokenDef|None)
         token = None
-        if text[0] == self._delimitter:
-            end = False
-            index = 0
-            while not end:
-                index += 1
-                if index >= len(text) or text[index] == self._delimitter:
-                    end = True
-            literal = text[0:index + 1]
-            token = TokenDef(self._tokenName, literal, self)
-            text = text[len(literal):]
-        return (text, token)
+        if text[position] == self._delimitter:
+            end = text.find(self._delimitter, position + 1)
+            if end < 0:
+                end = len(text)
+            else:
+                end += 1
+            token = TokenDef(self._tokenName, text[position:end], self)
+            position = end
+        return (position, token)
+        
+    def pattern(self): # return: string|None
+        if len(self._delimitter) != 1:
+            return None
+        delimitter = re.escape(self._delimitter)
+        return delimitter + r'[^' + delimitter + r']*' + delimitter + '?'
+        
+    def tokenDefForMatch(self, code: str): # return: TokenDef
+        return TokenDef(self._tokenName, code, self)
 
 class RegexMatcher(TokenMatcher):
     def __init__(self, pattern, tokenName, groupNo=0):
         self._pattern = pattern
+        self._compiled = re.compile(pattern)
         self._tokenName = tokenName
         self._groupNo = groupNo
 
     def lexNext(self, text): # return: (text, TokenDef|None)
+        (position, token) = self.matchAt(text, 0)
+        return (text[position:], token)
+        
+    def matchAt(self, text, position): # return: (position, TokenDef|None)
         token = None
-        rematch = re.match(self._pattern, text)
+        if self._isPositionIndependent():
+            rematch = self._compiled.match(text, position)
+        else:
+            rematch = self._compiled.match(text[position:])
         if rematch != None:
             matchedText = rematch.group(self._groupNo)
             token = TokenDef(self._tokenName, matchedText, self)
-            text = text[len(matchedText):]
-        return (text, token)
+            position += len(matchedText)
+        return (position, token)
+        
+    def pattern(self): # return: string|None
+        if self._groupNo != 0 or not self._isPositionIndependent():
+            return None
+        if self._compiled.flags & ~re.UNICODE:
+            return None
+        return self._pattern
+        
+    def tokenDefForMatch(self, code: str): # return: TokenDef
+        return TokenDef(self._tokenName, code, self)
+        
+    def _isPositionIndependent(self): # boolean
+        # Anchors, word-boundaries and lookbehinds behave differently when matching at a
+        # position instead of on a sliced string. Back-references would break when the
+        # pattern gets embedded into a bigger one. Better safe than sorry.
+        if type(self._pattern) != str:
+            return False
+        return re.search(r'(?<!\[)\^|\\[AbB0-9]|\(\?<[=!]|\(\?P=', self._pattern) == None
         
 class DirectTokenMatcher(TokenMatcher):
     def __init__(self, directTexts, tokenName):
@@ -99,13 +197,63 @@ class DirectTokenMatcher(TokenMatcher):
         self._tokenName = tokenName
 
     def lexNext(self, text): # return: (text, TokenDef|None)
+        (position, token) = self.matchAt(text, 0)
+        return (text[position:], token)
+        
+    def matchAt(self, text, position): # return: (position, TokenDef|None)
         token = None
         for directText in self._directTexts:
-            if text[0:len(directText)] == directText:
+            if text.startswith(directText, position):
                 token = TokenDef(self._tokenName, directText, self)
-                text = text[len(directText):]
+                position += len(directText)
                 break
-        return (text, token)
+        return (position, token)
+        
+    def pattern(self): # return: string|None
+        if len(self._directTexts) <= 0:
+            return None
+        return "|".join(map(re.escape, self._directTexts))
+        
+    def tokenDefForMatch(self, code: str): # return: TokenDef
+        return TokenDef(self._tokenName, code, self)
+
+class CompiledTokenMatcher(TokenMatcher):
+    # Combines several matchers that provide a pattern() into one alternation of named groups.
+    # Like in the matcher-list of a language, the first alternative that matches wins.
+    def __init__(self, matchers):
+        self._matchers = matchers
+        self._matchersByGroup = {}
+        alternatives = []
+        fallbacks = []
+        for index in range(0, len(matchers)):
+            matcher = matchers[index]
+            assert matcher.pattern() != None
+            group = "m" + str(index)
+            self._matchersByGroup[group] = matcher
+            alternatives.append("(?P<" + group + ">" + matcher.pattern() + ")")
+            if matcher.fallbackPattern() != None:
+                fallbacks.append(matcher.fallbackPattern())
+        if len(fallbacks) > 0:
+            alternatives.insert(0, "(?P<fallback>" + "|".join(fallbacks) + ")")
+        self._regex = re.compile("|".join(alternatives))
+
+    def lexNext(self, text): # return: (text, TokenDef|None)
+        (position, token) = self.matchAt(text, 0)
+        return (text[position:], token)
+        
+    def matchAt(self, text, position): # return: (position, TokenDef|None)
+        rematch = self._regex.match(text, position)
+        if rematch == None:
+            return (position, None)
+        group = rematch.lastgroup
+        if group == "fallback":
+            for matcher in self._matchers:
+                (end, token) = matcher.matchAt(text, position)
+                if token != None:
+                    return (end, token)
+            return (position, None)
+        matcher = self._matchersByGroup[group]
+        return (rematch.end(), matcher.tokenDefForMatch(rematch.group()))
 
 ### NODE PATTERNS
 
@@ -119,17 +267,25 @@ class TokenNodePattern(NodePattern):
     def producedNodeKey(self): # string
         return self._tokenName
         
-    def matches(self, nodes, index):
-        node = nodes[index]
+    def collectKeys(self, keys):
+        keys.add(self._tokenName)
+        
+    def matches(self, nodes, position):
+        node = nodes.node(position)
         expected = self._tokenName
         if isinstance(node, Token):
             return node.tokenName == expected or node.code == expected
         return False
         
-    def mutate(self, nodes, index):
-        node = nodes[index]
+    def matchSpan(self, nodes, position): # return (boolean, NodeListEntry|None)
+        if self.matches(nodes, position):
+            return (True, position)
+        return (False, None)
+        
+    def mutate(self, nodes, position):
+        node = nodes.node(position)
         assert isinstance(node, Token)
         expected = self._tokenName
         assert node.tokenName == expected or node.code == expected
-        return ([], index) # No mutation needed, the node is already the token
+        return ([], position) # No mutation needed, the node is already the token
         
\ No newline at end of file
@@ -38,5 +38,5 @@ class UnknownLanguage(Language):
     def stylesheet(self):
         return None
 
-    def formatForNode(self, node):
+    def createFormat(self, node):
         return None
\ No newline at end of file
@@ -0,0 +1,156 @@
+import sys, os, gc, time, marshal, zlib, hashlib
+from array import array
+
+from py.Hub import Log
+from py.Languages.Language import Language
+from py.Languages.AbstractSyntaxTree import ASTRoot
+from py.Languages.TokenStream import TokenStream
+from py.Languages.Tokens import Token
+from py.SyntaxTreeTransfer import SyntaxTreeSender, SyntaxTreeReceiver
+
+# Syntax-trees of code that was parsed before, on disk in the meta-folder of the versioning (next
+# to the project index), so that opening or indexing an unchanged file does not parse it again.
+# Entries are found by their content, not by a file path: each entry is one file named by a hash
+# of the language, the version of its grammar (see Language.grammarVersion) and the code. It
+# holds the token-stream and the syntax-tree (as a transfer, see SyntaxTreeTransfer), marshalled
+# and compressed. The codes of the tokens are left out where they are those of the token-stream.
+#
+# Entries that were not used for EINSICHT_PARSE_CACHE_DAYS (default 30) are removed, as are the
+# least recently used ones once all entries together exceed EINSICHT_PARSE_CACHE_MB (default 64).
+# Can be disabled with EINSICHT_PARSE_CACHE=0.
+
+FOLDER_NAME = "einsicht-parse-cache"
+ENTRY_SUFFIX = ".ast"
+
+# Must be increased whenever the format of the entries changes (including that of transfers)
+FORMAT_VERSION = 1
+
+class ParseCache:
+    def __init__(self, metaFolder: str):
+        self.folderPath = metaFolder + "/" + FOLDER_NAME
+        self.maxBytes = int(os.environ.get('EINSICHT_PARSE_CACHE_MB', 64)) * 1024 * 1024
+        self.maxAge = float(os.environ.get('EINSICHT_PARSE_CACHE_DAYS', 30)) * 24 * 60 * 60
+        self._bytes = None # of all entries, None until the folder was looked at (see evict)
+
+    @staticmethod
+    def isEnabled() -> bool:
+        return os.environ.get('EINSICHT_PARSE_CACHE', '1') == '1'
+
+    def load(self, language: Language, hash: str, code: str, filePath: str) -> tuple|None:
+        # return: (ASTRoot, list<Token>, TokenStream) of the code, None if there is no entry
+        # hash: md5 (hex) of the code
+        entryPath = self._entryPath(language, hash)
+        try:
+            with open(entryPath, "rb") as handle:
+                entry = marshal.loads(zlib.decompress(handle.read()))
+            (format, length, streamData, transferData) = entry
+            if format != FORMAT_VERSION or length != len(code):
+                return None
+            stream = TokenStream.deserialize(language, code, language.lexer().tokenTypes(), streamData)
+            (blocks, dataBytes, names, codes) = transferData
+            if codes == None:
+                codes = [stream.tokenCode(index) for index in range(0, len(stream))]
+            data = array('i')
+            data.frombytes(dataBytes)
+
+            # Building the nodes allocates lots of objects but no garbage, the garbage collector
+            # would only keep scanning the objects that are already there.
+            collecting = gc.isenabled()
+            gc.disable()
+            try:
+                receiver = SyntaxTreeReceiver(language)
+                (syntaxTree, tokens) = receiver.receive((filePath, blocks, {}, data, names, codes), code)
+            finally:
+                if collecting:
+                    gc.enable()
+            os.utime(entryPath) # The age of an entry counts from when it was last used
+
+        except FileNotFoundError:
+            return None
+
+        except (OSError, EOFError, ValueError, TypeError, IndexError, KeyError, zlib.error):
+            Log.error("Removing broken parse cache entry %s: %s" % (entryPath, Log.normalize(sys.exc_info()[1])))
+            self._remove(entryPath)
+            return None
+
+        return (syntaxTree, tokens, stream)
+
+    def store(
+        self,
+        language: Language,
+        hash: str,
+        code: str,
+        syntaxTree: ASTRoot,
+        tokens: list[Token],
+        stream: TokenStream
+    ) -> None:
+        try:
+            (filePath, blocks, moves, data, names, codes) = SyntaxTreeSender().send(syntaxTree, tokens)
+        except TypeError:
+            return # The syntax-tree has nodes that cannot be transferred
+        if codes == [stream.tokenCode(index) for index in range(0, len(stream))]:
+            codes = None
+        entry = zlib.compress(marshal.dumps((
+            FORMAT_VERSION,
+            len(code),
+            stream.serialize(),
+            (blocks, data.tobytes(), names, codes)
+        )), 1)
+
+        # Written under another name first, so that no other process reads half an entry
+        entryPath = self._entryPath(language, hash)
+        temporaryPath = entryPath + "." + str(os.getpid()) + ".tmp"
+        try:
+            os.makedirs(self.folderPath, exist_ok=True)
+            with open(temporaryPath, "wb") as handle:
+                handle.write(entry)
+            os.replace(temporaryPath, entryPath)
+        except OSError:
+            Log.error("While writing parse cache entry: %s" % Log.normalize(sys.exc_info()[1]))
+            self._remove(temporaryPath)
+            return
+
+        if self._bytes != None:
+            self._bytes += len(entry)
+        if self._bytes == None or self._bytes > self.maxBytes:
+            self.evict()
+
+    def evict(self) -> None:
+        # Removes all entries that are too old, then the least recently used ones until the
+        # rest takes up three quarters of the limit, which leaves room for new entries. The
+        # most recently used entry is kept in any case.
+        try:
+            fileNames = os.listdir(self.folderPath)
+        except OSError:
+            return
+        now = time.time()
+        entries = [] # (mtime, size, path)
+        for fileName in fileNames:
+            entryPath = self.folderPath + "/" + fileName
+            try:
+                stat = os.stat(entryPath)
+            except OSError:
+                continue # Removed by another process in the meantime
+            if now - stat.st_mtime > self.maxAge:
+                self._remove(entryPath)
+            elif fileName.endswith(ENTRY_SUFFIX):
+                entries.append((stat.st_mtime, stat.st_size, entryPath))
+
+        self._bytes = sum(size for (mtime, size, entryPath) in entries)
+        if self._bytes > self.maxBytes:
+            entries.sort()
+            for (mtime, size, entryPath) in entries[:-1]:
+                if self._bytes <= self.maxBytes * 3 / 4:
+                    break
+                self._remove(entryPath)
+                self._bytes -= size
+
+    def _entryPath(self, language: Language, hash: str) -> str:
+        key = "\0".join((language.name(), language.grammarVersion(), hash))
+        return self.folderPath + "/" + hashlib.md5(key.encode()).hexdigest() + ENTRY_SUFFIX
+
+    def _remove(self, filePath: str) -> None:
+        try:
+            os.remove(filePath)
+        except OSError:
+            pass
@@ -0,0 +1,180 @@
+import os, logging, traceback, multiprocessing, queue
+
+from PySide6 import QtCore
+from PySide6.QtCore import QSocketNotifier
+
+from py.Hub import Hub, Log
+from py.Languages.Language import Language
+from py.Languages.LanguageSelector import LanguageSelector
+from py.Versioning.VersioningSelector import VersioningSelector
+from py.Languages.AbstractSyntaxTree import ASTRoot
+from py.Languages.Tokens import Token
+from py.SyntaxTreeTransfer import SyntaxTreeSender, SyntaxTreeReceiver
+from py.ParseCache import ParseCache
+
+# Parsing is pure python and holds the GIL, so it is done in a separate process: the editor
+# sends each change of the document to the worker and keeps running, the worker sends back
+# the syntax-tree of the newest code it has seen. Requests that were superseded by newer ones
+# before the worker got to them are not parsed, results that were superseded while being parsed
+# are not delivered. Can be disabled with EINSICHT_PARSE_WORKER=0 (parses on the GUI thread).
+
+class ParseWorker(QtCore.QObject):
+    def __init__(self, parent: QtCore.QObject, hub: Hub):
+        super().__init__(parent)
+        self.hub = hub
+        self._receiver = None
+        self._request = None # (filePath, code) of the last request
+        self._generation = None # of the last request, only results of that one are delivered
+
+        # Requests are sent through a queue, which does not block while the worker is busy.
+        # Results come back through a pipe, which is watched by the Qt event loop.
+        context = multiprocessing.get_context("spawn") # Forking a running Qt application is not safe
+        self._requests = context.Queue()
+        (self._connection, workerConnection) = context.Pipe(False)
+        self._process = context.Process(
+            target=runWorker,
+            args=(self._requests, workerConnection),
+            name="einsicht-parse-worker",
+            daemon=True
+        )
+        self._process.start()
+        workerConnection.close()
+
+        self._notifier = QSocketNotifier(self._connection.fileno(), QSocketNotifier.Read, self)
+        self._notifier.activated.connect(self._receive)
+
+    @staticmethod
+    def isEnabled() -> bool:
+        return os.environ.get('EINSICHT_PARSE_WORKER', '1') == '1'
+
+    def open(self, language: Language, filePath: str, code: str, generation: int) -> None:
+        # Replaces the code of the worker. The generation identifies the code (see parsed).
+        if self._receiver == None or self._receiver.language is not language:
+            self._receiver = SyntaxTreeReceiver(language)
+        self._send(generation, filePath, code, ("open", filePath, code))
+
+    def change(self, previousCode: str, code: str, change: tuple, generation: int) -> None:
+        # change: (position, removed, added) that turned previousCode into code, as reported
+        # by QTextDocument.contentsChange. Only the change is sent to the worker, unless it
+        # does not describe the difference between both codes.
+        (position, removed, added) = change
+        filePath = self._request[0]
+        if len(code) == len(previousCode) + added - removed and \
+            code[:position] == previousCode[:position] and \
+            code[position + added:] == previousCode[position + removed:]:
+            message = ("change", position, removed, code[position:position + added])
+        else:
+            message = ("open", filePath, code)
+        self._send(generation, filePath, code, message)
+
+    def close(self) -> None:
+        self._notifier.setEnabled(False)
+        self._requests.put(None)
+        self._process.join(1)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._requests.cancel_join_thread()
+        self._requests.close()
+        self._connection.close()
+
+    def parsed(self, syntaxTree: ASTRoot, tokens: list[Token], generation: int) -> None:
+        # The syntax-tree of the newest code was received from the worker
+        self.hub.notify(ParseWorker.parsed, syntaxTree, tokens, generation)
+
+    def _send(self, generation: int, filePath: str, code: str, message: tuple) -> None:
+        self._generation = generation
+        self._request = (filePath, code)
+        self._requests.put((generation,) + message)
+
+    def _receive(self) -> None:
+        # Every result builds on the previous one, so all of them are received in order
+        result = None
+        try:
+            while self._connection.poll():
+                (generation, transfer, error) = self._connection.recv()
+                if error != None:
+                    Log.error("Parse worker failed: " + error)
+                else:
+                    code = self._request[1] if generation == self._generation else None
+                    result = (generation, self._receiver.receive(transfer, code))
+        except (EOFError, OSError):
+            Log.error("Parse worker has stopped")
+            self._notifier.setEnabled(False)
+            return
+
+        if result != None and result[0] == self._generation:
+            (syntaxTree, tokens) = result[1]
+            self.parsed(syntaxTree, tokens, self._generation)
+
+def runWorker(requests, connection) -> None:
+    # Main loop of the worker process
+    Log.registerLogger(logging.getLogger('einsicht.parse-worker'))
+    hub = Hub()
+    selector = LanguageSelector(hub)
+    versioningSelector = VersioningSelector(hub)
+    sender = SyntaxTreeSender()
+    (language, filePath, code) = (None, None, "")
+    (syntaxTree, tokens) = (None, None)
+
+    while True:
+        messages = [requests.get()]
+        try:
+            while True:
+                messages.append(requests.get_nowait())
+        except queue.Empty:
+            pass
+
+        # Requests that arrived in the meantime are combined into one
+        change = None
+        for message in messages:
+            if message == None:
+                return
+            if message[1] == "open":
+                (generation, kind, newFilePath, code) = message
+                if language == None or newFilePath != filePath:
+                    filePath = newFilePath
+                    language = selector.selectForFilePath(filePath)
+                    versioning = versioningSelector.selectVersioningFor(filePath)
+                    if versioning != None and ParseCache.isEnabled():
+                        language.setParseCache(ParseCache(versioning.metaFolder()))
+                (syntaxTree, tokens, change) = (None, None, None)
+            else:
+                (generation, kind, position, removed, addedCode) = message
+                code = code[:position] + addedCode + code[position + removed:]
+                if syntaxTree != None:
+                    change = combineChanges(change, (position, removed, len(addedCode)))
+
+        try:
+            if change != None:
+                (syntaxTree, tokens) = language.parse(code, filePath, syntaxTree, tokens, change)
+            else:
+                (syntaxTree, tokens) = language.parse(code, filePath)
+            (transfer, error) = (None, None)
+        except:
+            (syntaxTree, tokens) = (None, None)
+            error = traceback.format_exc()
+
+        if requests.empty():
+            if error == None:
+                try:
+                    transfer = sender.send(syntaxTree, tokens)
+                except:
+                    # The editor keeps the syntax-tree it has, the next transfer is a complete one
+                    sender = SyntaxTreeSender()
+                    error = traceback.format_exc()
+            try:
+                connection.send((generation, transfer, error))
+            except OSError:
+                return
+
+def combineChanges(first: tuple|None, second: tuple) -> tuple:
+    # One change (position, removed, added) that covers the change first followed by second
+    if first == None:
+        return second
+    (firstPosition, firstRemoved, firstAdded) = first
+    (secondPosition, secondRemoved, secondAdded) = second
+    position = min(firstPosition, secondPosition)
+    end = max(firstPosition + firstAdded, secondPosition + secondRemoved)
+    removedEnd = firstPosition + firstRemoved + end - (firstPosition + firstAdded)
+    addedEnd = end + secondAdded - secondRemoved
+    return (position, removedEnd - position, addedEnd - position)
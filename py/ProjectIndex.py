@@ -2,10 +2,12 @@
 import sqlite3, os, uuid, hashlib
 
 from threading import Lock
+from os.path import dirname
 from PySide6.QtCore import QTimer
 
 from py.Languages.LanguageSelector import LanguageSelector
 from py.Languages.Language import FileContext, ClassDef, PositionDef, MethodDef, MemberDef, Language
+from py.ParseCache import ParseCache
 from py.Hub import Log
 
 class ProjectIndex:
@@ -15,6 +17,9 @@ class ProjectIndex:
         self._lock = Lock()
         self._inQuery = False
         self._langSelector = None
+        self._parseCache = None
+        if ParseCache.isEnabled():
+            self._parseCache = ParseCache(dirname(dbFilePath)) # Shares the folder of the database
         self._classDefs = {}
         self._methodDefs = {}
         self._memberDefs = {}
@@ -154,6 +159,7 @@ class ProjectIndex:
                 if self._langSelector == None:
                     self._langSelector = LanguageSelector()
                 language = self._langSelector.selectForFilePath(filePath)
+            language.setParseCache(self._parseCache)
             
             with open(filePath, "r") as handle:
                 fileContents = handle.read()
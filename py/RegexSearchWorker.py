@@ -0,0 +1,190 @@
+import os, re, time, queue, multiprocessing
+from array import array
+
+from PySide6 import QtCore
+from PySide6.QtCore import QSocketNotifier
+
+from py.Hub import Hub, Log
+
+# Regular expressions given by the user can take practically forever to match (f.e. "(a+)+b" on
+# a long line of a's), and the re module cannot be interrupted while matching. So they are
+# matched in a separate process, which gets killed once a search takes longer than
+# EINSICHT_REGEX_TIMEOUT_MS (default 1000) and is started again for the next search. The time
+# it takes to start the process does not count. Only the offsets and lengths of the first
+# MAX_MATCHES (non-empty) matches are sent back.
+
+MAX_MATCHES = 100000
+
+READY = "ready" # sent by the worker once it has started
+
+class RegexSearchWorker(QtCore.QObject):
+    def __init__(self, parent: QtCore.QObject, hub: Hub):
+        super().__init__(parent)
+        self.hub = hub
+        self.timeout = int(os.environ.get('EINSICHT_REGEX_TIMEOUT_MS', 1000)) / 1000
+        self._process = None # started on the first search
+        self._ready = False # True once the process has started
+        self._revision = None # of the code the worker has, None if it has none
+        self._request = None # (generation, revision, text, pattern, flags) of the last search
+        self._sentAt = None # perf_counter of the oldest search that was not answered yet
+        self._requestedAt = None # perf_counter of the last search
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._onTimeout)
+
+    def search(self, generation: int, revision: int, text: str, pattern: str, flags: int) -> None:
+        # Matches pattern in text (that of the revision of the document), the result is reported
+        # with the generation (see found and failed). Replaces the previous search.
+        self._request = (generation, revision, text, pattern, flags)
+        self._requestedAt = time.perf_counter()
+        if self._process == None:
+            self._start()
+        if self._sentAt == None:
+            self._sentAt = time.perf_counter()
+            if self._ready:
+                self._timer.start(int(self.timeout * 1000))
+        self._send()
+
+    def cancel(self) -> None:
+        # The result of the last search is not needed (anymore)
+        self._request = None
+
+    def close(self) -> None:
+        self._timer.stop()
+        self._stop()
+
+    def found(self, generation: int, offsets: array, lengths: array, complete: bool) -> None:
+        # complete: False if there were more than MAX_MATCHES matches
+        self.hub.notify(RegexSearchWorker.found, generation, offsets, lengths, complete)
+
+    def failed(self, generation: int, message: str) -> None:
+        self.hub.notify(RegexSearchWorker.failed, generation, message)
+
+    def _start(self) -> None:
+        context = multiprocessing.get_context("spawn") # Forking a running Qt application is not safe
+        self._requests = context.Queue()
+        (self._connection, workerConnection) = context.Pipe(False)
+        self._process = context.Process(
+            target=runWorker,
+            args=(self._requests, workerConnection),
+            name="einsicht-regex-worker",
+            daemon=True
+        )
+        self._process.start()
+        workerConnection.close()
+        self._revision = None
+        self._ready = False
+        self._notifier = QSocketNotifier(self._connection.fileno(), QSocketNotifier.Read, self)
+        self._notifier.activated.connect(self._receive)
+
+    def _stop(self) -> None:
+        if self._process == None:
+            return
+        self._notifier.setEnabled(False)
+        self._process.terminate()
+        self._process.join(1)
+        self._requests.cancel_join_thread()
+        self._requests.close()
+        self._connection.close()
+        self._process = None
+
+    def _send(self) -> None:
+        # The code is only sent when it is not the one the worker already has
+        (generation, revision, text, pattern, flags) = self._request
+        if revision == self._revision:
+            text = None
+        self._revision = revision
+        self._requests.put((generation, revision, text, pattern, flags))
+
+    def _receive(self) -> None:
+        result = None
+        try:
+            while self._connection.poll():
+                message = self._connection.recv()
+                if message == READY:
+                    self._ready = True
+                else:
+                    result = message
+        except (EOFError, OSError):
+            Log.error("Regex search worker has stopped")
+            self._stop()
+            return
+        if result == None:
+            if self._sentAt != None and not self._timer.isActive():
+                self._sentAt = time.perf_counter()
+                self._timer.start(int(self.timeout * 1000))
+            return
+        (generation, offsets, lengths, complete, error) = result
+        if self._request == None or generation != self._request[0]:
+            # Superseded, the worker goes on with the newest search (if there is one)
+            if self._request != None:
+                self._sentAt = time.perf_counter()
+                self._timer.start(int(self.timeout * 1000))
+            else:
+                self._sentAt = None
+                self._timer.stop()
+            return
+        self._sentAt = None
+        self._timer.stop()
+        if error != None:
+            self.failed(generation, error)
+        else:
+            self.found(generation, bytesToArray(offsets), bytesToArray(lengths), complete)
+
+    def _onTimeout(self) -> None:
+        # The worker is stuck on some search. The last one only counts as the culprit if it was
+        # waiting for long enough itself, otherwise it gets its own chance in a new worker.
+        self._stop()
+        self._sentAt = None
+        if self._request == None:
+            return
+        waited = time.perf_counter() - self._requestedAt
+        if waited >= self.timeout:
+            self.failed(self._request[0], "Search took longer than %d ms" % (self.timeout * 1000))
+            return
+        self._start()
+        self._sentAt = time.perf_counter()
+        self._send()
+
+def runWorker(requests, connection) -> None:
+    # Main loop of the worker process
+    text = ""
+    connection.send(READY)
+    while True:
+        messages = [requests.get()]
+        try:
+            while True:
+                messages.append(requests.get_nowait())
+        except queue.Empty:
+            pass
+        if None in messages:
+            return
+
+        # Only the last search counts, but all messages may bring code
+        for (generation, revision, newText, pattern, flags) in messages:
+            if newText != None:
+                text = newText
+
+        (offsets, lengths, complete, error) = (array('i'), array('i'), True, None)
+        try:
+            for match in re.compile(pattern, flags).finditer(text):
+                (start, end) = match.span()
+                if start == end:
+                    continue
+                if len(offsets) >= MAX_MATCHES:
+                    complete = False
+                    break
+                offsets.append(start)
+                lengths.append(end - start)
+        except (re.error, RecursionError, MemoryError) as exception:
+            error = str(exception)
+
+        try:
+            connection.send((generation, offsets.tobytes(), lengths.tobytes(), complete, error))
+        except OSError:
+            return
+
+def bytesToArray(data: bytes) -> array:
+    values = array('i')
+    values.frombytes(data)
+    return values
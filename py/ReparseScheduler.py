@@ -0,0 +1,143 @@
+import sys, os
+
+from PySide6 import QtCore, QtGui
+from PySide6.QtCore import QTimer
+
+from py.Hub import Hub, Log
+from py.Languages.Language import Language
+from py.Languages.AbstractSyntaxTree import ASTRoot
+from py.Languages.Tokens import Token
+from py.ParseWorker import ParseWorker, combineChanges
+
+# The one place that turns changes of the document into syntax-trees. All contentsChange events
+# that arrive within a short time are combined into one snapshot of the document, which gets a
+# new generation number. Each snapshot is parsed (in the parse worker, or right here), but only
+# the syntax-tree of the newest generation is passed on, exactly once: results for generations
+# that were already superseded by newer snapshots never reach the consumers.
+#
+# The delay (in milliseconds) can be changed with EINSICHT_REPARSE_DELAY.
+
+class ReparseScheduler(QtCore.QObject):
+    def __init__(self, parent: QtCore.QObject, hub: Hub):
+        super().__init__(parent)
+        self.hub = hub
+        self._language = None
+        self._filePath = None
+        self._worker = None
+        self._code = "" # of the newest snapshot
+        self._change = None # (position, removed, added) since the newest snapshot
+        self._generation = 0 # of the newest snapshot
+        self._parsedGeneration = None # of the last syntax-tree that was passed on
+        (self._syntaxTree, self._tokens) = (None, None)
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(int(os.environ.get('EINSICHT_REPARSE_DELAY', 10)))
+        self._timer.timeout.connect(self.flush)
+
+        self.hub.on(self.hub.get(QtGui.QTextDocument).contentsChange, self._onContentsChange)
+        self.hub.on(ParseWorker.parsed, self._onWorkerParsed)
+
+    def open(self, language: Language|None, filePath: str|None, code: str) -> None:
+        # Starts over with the given code, f.e. when a file was opened (or closed)
+        self._timer.stop()
+        if self._worker != None and (language == None or not ParseWorker.isEnabled()):
+            self.close()
+        if language != None and self._worker == None and ParseWorker.isEnabled():
+            self._worker = ParseWorker(self, self.hub)
+
+        (self._language, self._filePath) = (language, filePath)
+        (self._syntaxTree, self._tokens) = (None, None)
+        self._snapshot(code, None)
+
+    def close(self) -> None:
+        if self._worker != None:
+            self._worker.close()
+            self._worker = None
+        self._language = None
+
+    def code(self) -> str:
+        # The newest snapshot, without changes that are not flushed yet
+        return self._code
+
+    def generation(self) -> int:
+        return self._generation
+
+    def isCurrent(self) -> bool:
+        # Whether the last syntax-tree that was passed on belongs to the newest snapshot
+        return self._parsedGeneration == self._generation
+
+    def flush(self) -> None:
+        # Takes a snapshot of the document now, instead of waiting for more changes
+        self._timer.stop()
+        if self._change == None:
+            return
+        code = self.hub.get(QtGui.QTextDocument).toPlainText()
+        change = self._change
+        self._change = None
+        if code != self._code:
+            self._snapshot(code, self._clampChange(change, self._code, code))
+
+    def changed(self, code: str) -> None:
+        # A new snapshot of the document was taken
+        self.hub.notify(ReparseScheduler.changed, code)
+
+    def parsed(self, syntaxTree: ASTRoot|None, tokens: list[Token]) -> None:
+        # The syntax-tree of the newest snapshot
+        self.hub.notify(ReparseScheduler.parsed, syntaxTree, tokens)
+
+    def _onContentsChange(self, position: int, removed: int, added: int) -> None:
+        self._change = combineChanges(self._change, (position, removed, added))
+        self._timer.start()
+
+    def _clampChange(self, change: tuple, previousCode: str, code: str) -> tuple|None:
+        # Qt counts the implicit paragraph separator at the end of the document when a change
+        # reaches it (f.e. with setPlainText), so the change can exceed the code. None if the
+        # change does not fit the code at all, which makes the code get parsed from scratch.
+        (position, removed, added) = change
+        removed = min(removed, len(previousCode) - position)
+        added = removed + len(code) - len(previousCode)
+        if position < 0 or removed < 0 or added < 0 or position + added > len(code):
+            return None
+        return (position, removed, added)
+
+    def _snapshot(self, code: str, change: tuple|None) -> None:
+        previousCode = self._code
+        self._generation += 1
+        self._code = code
+        self.changed(code)
+
+        if self._language == None:
+            return
+
+        if self._worker != None:
+            if change != None:
+                self._worker.change(previousCode, code, change, self._generation)
+            else:
+                self._worker.open(self._language, self._filePath, code, self._generation)
+
+        else:
+            if change == None:
+                (self._syntaxTree, self._tokens) = (None, None)
+            try:
+                (syntaxTree, tokens) = self._language.parse(
+                    code,
+                    self._filePath,
+                    self._syntaxTree,
+                    self._tokens,
+                    change
+                )
+            except:
+                Log.error("While parsing: %s" % Log.normalize(sys.exc_info()[1]))
+                return
+            self._deliver(self._generation, syntaxTree, tokens)
+
+    def _onWorkerParsed(self, syntaxTree: ASTRoot|None, tokens: list[Token], generation: int) -> None:
+        self._deliver(generation, syntaxTree, tokens)
+
+    def _deliver(self, generation: int, syntaxTree: ASTRoot|None, tokens: list[Token]) -> None:
+        if generation != self._generation or generation == self._parsedGeneration:
+            return # Superseded by a newer snapshot, or already passed on
+        self._parsedGeneration = generation
+        (self._syntaxTree, self._tokens) = (syntaxTree, tokens)
+        self.parsed(syntaxTree, tokens)
@@ -0,0 +1,215 @@
+import sys, itertools
+from array import array
+
+from py.Languages.Language import Language
+from py.Languages.AbstractSyntaxTree import ASTNode, ASTBranch, ASTRoot, SourceBuffer
+from py.Languages.SemanticASTNodes import CodeBlock
+from py.Languages.Tokens import Token
+
+# Transferring a syntax-tree, from the parse worker to the editor (see ParseWorker) or through
+# the parse cache on disk (see ParseCache): Incremental parsing re-uses most statements (the
+# nodes directly in a code-block or the root) of the previous syntax-tree, so only the
+# statements that the receiver does not have yet are sent. Of all others, only how far they
+# were moved.
+#
+# A transfer is a tuple (filePath, blocks, moves, data, names, codes), or None for empty code:
+#  - blocks: the children of the root, each either the id of a statement or a code-block as
+#    a tuple (row, column, offset, children).
+#  - moves: id => (offsetDelta, rowDelta, colDelta) of the statements that were moved since
+#    they were sent. Only where that differs from the previous re-used statement (in the order
+#    of blocks), as an edit moves all statements behind it the same way. The colDelta applies
+#    to the first row of the statement (see ASTNode.shiftTree).
+#  - data: the nodes of all new statements in the order of blocks, as flat array of integers,
+#    eight per node in pre-order: the kind of node, its token-name or type (index in names),
+#    row, column, offset and the number of prepended nodes, children and appended nodes, which
+#    follow in that order.
+#  - codes: the code of each token in data. Branches take their code from the code of the
+#    request instead (see SyntaxTreeReceiver.receive).
+
+NODE_TOKEN = 0
+NODE_RELEVANT_TOKEN = 1 # Part of the token-list returned by Language.parse
+NODE_BRANCH = 2
+
+NODE_FIELDS = 8
+
+class SyntaxTreeSender:
+    _ids = itertools.count()
+
+    def __init__(self):
+        self._sent = {} # ASTNode => (int: id, ASTNode: first node of its code), known to the receiver
+        self._firstPositions = {} # id => (offset, row, col) of that first node, when it was sent
+
+    def send(self, syntaxTree: ASTRoot|None, tokens: list[Token]) -> tuple|None:
+        sent = {}
+        moves = {}
+        (data, names, codes) = (array('i'), {}, [])
+        relevantTokens = set(tokens)
+        lastMove = (0, 0, 0)
+
+        def sendChildren(parent): # list
+            nonlocal lastMove
+            blocks = []
+            for child in parent.children:
+                if isinstance(child, CodeBlock):
+                    blocks.append((child.row, child.col, child.offset, sendChildren(child)))
+                    continue
+                if child in self._sent:
+                    (id, first) = self._sent[child]
+                    (offset, row, col) = self._firstPositions[id]
+                    move = (first.offset - offset, first.row - row, first.col - col)
+                    if move != lastMove:
+                        moves[id] = lastMove = move
+                else:
+                    (id, first) = (next(SyntaxTreeSender._ids), child.firstCodeNode())
+                    serializeNode(child, data, names, codes, relevantTokens)
+                sent[child] = (id, first)
+                blocks.append(id)
+            return blocks
+
+        transfer = None
+        if syntaxTree != None:
+            blocks = sendChildren(syntaxTree)
+            transfer = (syntaxTree.filepath(), blocks, moves, data, list(names), codes)
+
+        self._sent = sent
+        self._firstPositions = {}
+        for (id, first) in sent.values():
+            self._firstPositions[id] = (first.offset, first.row, first.col)
+        return transfer
+
+class SyntaxTreeReceiver:
+    def __init__(self, language: Language):
+        self.language = language
+        self._statements = {} # id => (ASTNode, list<Token>: its relevant tokens)
+        self._source = SourceBuffer("") # shared by all received nodes
+
+    def receive(self, transfer: tuple|None, code: str|None) -> tuple:
+        # return: (ASTRoot|None, list<Token>), as returned by Language.parse
+        # The code that was parsed is not transferred, the sender of the request still has it.
+        # Without it (None), branches keep showing the previous code, which is fine for
+        # syntax-trees that do not get used anyway.
+        if code != None:
+            self._source.text = code
+        if transfer == None:
+            self._statements = {}
+            return (None, [])
+
+        (filePath, blocks, moves, data, names, codes) = transfer
+        statements = {}
+        tokens = []
+        reader = NodeReader(self.language, data.tolist(), names, codes, self._source)
+        move = (0, 0, 0)
+
+        def receiveChildren(blocks): # list<ASTNode>
+            nonlocal move
+            children = []
+            for entry in blocks:
+                if isinstance(entry, tuple):
+                    (row, col, offset, subBlocks) = entry
+                    block = CodeBlock(self.language, row, col, offset)
+                    for child in receiveChildren(subBlocks):
+                        block.addStatement(child)
+                    children.append(block)
+                    continue
+                if entry in self._statements:
+                    (statement, statementTokens) = self._statements[entry]
+                    move = moves.get(entry, move)
+                    if move != (0, 0, 0):
+                        (offsetDelta, rowDelta, colDelta) = move
+                        colRow = statement.firstCodeNode().row
+                        statement.shiftTree(offsetDelta, rowDelta, colDelta, colRow)
+                else:
+                    statementTokens = []
+                    statement = reader.read(statementTokens)
+                statements[entry] = (statement, statementTokens)
+                tokens.extend(statementTokens)
+                children.append(statement)
+            return children
+
+        syntaxTree = ASTRoot(receiveChildren(blocks), filePath)
+        self._statements = statements
+        return (syntaxTree, tokens)
+
+def serializeNode(node: ASTNode, data: array, names: dict, codes: list, relevantTokens: set) -> None:
+    if isinstance(node, Token):
+        kind = NODE_RELEVANT_TOKEN if node in relevantTokens else NODE_TOKEN
+        name = node.tokenName
+        codes.append(node.code)
+    elif type(node) == ASTBranch:
+        (kind, name) = (NODE_BRANCH, node.type)
+    else:
+        raise TypeError("Cannot transfer syntax-tree node " + str(type(node)))
+
+    if name not in names:
+        names[name] = len(names)
+    data.extend((
+        kind,
+        names[name],
+        node.row,
+        node.col,
+        node.offset,
+        len(node.prepended),
+        len(node.children),
+        len(node.appended)
+    ))
+    for subNode in node.prepended:
+        serializeNode(subNode, data, names, codes, relevantTokens)
+    for subNode in node.children:
+        serializeNode(subNode, data, names, codes, relevantTokens)
+    for subNode in node.appended:
+        serializeNode(subNode, data, names, codes, relevantTokens)
+
+class NodeReader:
+    # Reads the nodes written by serializeNode, one (sub-)tree after the other
+    def __init__(
+        self, 
+        language: Language, 
+        data: list[int], 
+        names: list[str], 
+        codes: list[str], 
+        source: SourceBuffer
+    ):
+        self._language = language
+        self._data = data
+        self._names = names
+        self._codes = codes
+        self._source = source
+        self._index = 0
+        self._codeIndex = 0
+        self._end = 0 # Offset right after the code of the last token that was read
+
+    def read(self, tokens: list[Token]) -> ASTNode:
+        # The relevant tokens of the tree get appended to tokens
+        data = self._data
+        index = self._index
+        kind = data[index]
+        self._index = index + NODE_FIELDS
+
+        if kind != NODE_BRANCH:
+            code = sys.intern(self._codes[self._codeIndex])
+            self._codeIndex += 1
+
+        prepended = None
+        if data[index + 5] > 0:
+            prepended = [self.read(tokens) for count in range(0, data[index + 5])]
+
+        if kind == NODE_BRANCH:
+            children = [self.read(tokens) for count in range(0, data[index + 6])]
+            # The children end with the last token read, which saves walking to it
+            length = self._end - children[0].codeStart()
+            node = ASTBranch(children, self._names[data[index + 1]], None, length)
+            (node.row, node.col, node.offset) = (data[index + 2], data[index + 3], data[index + 4])
+        else:
+            (row, col, offset) = (data[index + 2], data[index + 3], data[index + 4])
+            node = Token(self._language, self._names[data[index + 1]], code, row, col, offset, self._source)
+            self._end = offset + len(code)
+            if kind == NODE_RELEVANT_TOKEN:
+                tokens.append(node)
+
+        if prepended != None:
+            node.prepended = prepended
+
+        if data[index + 7] > 0:
+            node.appended = [self.read(tokens) for count in range(0, data[index + 7])]
+
+        return node
@@ -1,8 +1,27 @@
 
 from PySide6 import QtCore, QtWidgets, QtGui
-import os
+import os, re, time, bisect
 
 from py.Hub import Hub, Log
+from py.RegexSearchWorker import RegexSearchWorker
+
+# Searching happens in time-slices of EINSICHT_SEARCH_SLICE_MS (default 10) on the event loop,
+# so typing in the search-field does not wait for a search through a large document: the first
+# slice publishes what it found (stopping early once there are FIRST_RESULTS occurences, about a
+# screen full), the rest are added when the search is complete. Each change of the pattern
+# cancels the search that is still running. A pattern that extends the previous one only checks
+# the occurences of that one, as long as the document did not change in the meantime and both
+# are searched for as they are (case-sensitively, not as whole words or regex).
+#
+# Besides searching for the pattern as it is, the pattern can be searched case-insensitively,
+# as whole words and as a regular expression. The first two are compiled into a matcher (see
+# matcherFor) that is searched with in the same time-slices. Regular expressions are matched
+# in a separate process instead, which has a timeout (see RegexSearchWorker).
+
+FIRST_RESULTS = 100
+
+# Characters that make up words, as in the symbols of the languages
+WORD_CHARACTERS = "A-Za-z0-9_"
 
 class SearchBar(QtWidgets.QWidget):
     def __init__(self, hub: Hub):
@@ -12,6 +31,17 @@ class SearchBar(QtWidgets.QWidget):
         
         self.hub = hub
         self._results = []
+        self._sliceSeconds = int(os.environ.get('EINSICHT_SEARCH_SLICE_MS', 10)) / 1000
+        self._search = None # InFileSearch of the current pattern
+        self._result = None # InFileSearchResult of the current search, None until published
+        self._code = None # InFileSearchCode of the document, as of its revision
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._continueSearch)
+        self._generation = 0 # of the current search, to recognize the results of regex searches
+        self._regexWorker = None # RegexSearchWorker, started on the first regex search
+        hub.on(RegexSearchWorker.found, self._onRegexFound)
+        hub.on(RegexSearchWorker.failed, self._onRegexFailed)
         
         hbox = QtWidgets.QHBoxLayout()
         self.setLayout(hbox)
@@ -22,6 +52,20 @@ class SearchBar(QtWidgets.QWidget):
         self.lineEdit.textChanged.connect(self.onTextChanged)
         self.setFont(QtGui.QFont("Mono"))
         hbox.addWidget(self.lineEdit, 0) 
+        
+        self.caseSensitiveButton = self._addModeButton(hbox, "Aa", "Match case", True)
+        self.wholeWordsButton = self._addModeButton(hbox, "W", "Match whole words", False)
+        self.regexButton = self._addModeButton(hbox, ".*", "Regular expression", False)
+        
+    def _addModeButton(self, hbox, text, toolTip, checked): # QToolButton
+        button = QtWidgets.QToolButton(self)
+        button.setText(text)
+        button.setToolTip(toolTip)
+        button.setCheckable(True)
+        button.setChecked(checked)
+        button.toggled.connect(self.onTextChanged)
+        hbox.addWidget(button, 0)
+        return button
 
     def toggle(self):
         if self.isVisible():
@@ -35,25 +79,207 @@ class SearchBar(QtWidgets.QWidget):
             
     def onTextChanged(self): 
         pattern = self.lineEdit.text()
+        mode = (
+            self.caseSensitiveButton.isChecked(),
+            self.wholeWordsButton.isChecked(),
+            self.regexButton.isChecked()
+        )
         
         document = self.hub.get(QtGui.QTextDocument)
-        text = document.toPlainText()
-        offset = 0
-        line = 1
-       
-        results = []
-        position = text.find(pattern, offset)
-        while position >= offset:
-            line += text[offset:position].count("\n")
-            column = position - text.rfind("\n", 0, position) - 1
-            if column == -1:
-                column = 0
-            results.append(InFileSearchOccurence(position, line, column, pattern, pattern))
-            offset = position
-            position = text.find(pattern, offset + 1)
+        if self._code == None or self._code.revision != document.revision():
+            self._code = InFileSearchCode(document.toPlainText(), document.revision())
+            
+        self._generation += 1
+        self._result = None
+        self._timer.stop()
+        if self._regexWorker != None:
+            self._regexWorker.cancel()
+        self._setError(None)
+        
+        try:
+            matcher = matcherFor(pattern, *mode)
+        except re.error as exception:
+            self._search = None
+            self._setError(str(exception))
+            InFileSearchResult([], self.hub)
+            return
+        
+        # Occurences of a longer pattern are among those of the shorter one, but only if those
+        # are all of them: The matcher (case-insensitive, whole words or regex) skips occurences
+        # that overlap with the one in front of them, so only a pattern as it is can be refined.
+        previous = self._search
+        if previous != None and previous.isDone() and previous.code is self._code and \
+            mode == (True, False, False) and previous.mode == mode and \
+            len(previous.pattern) > 0 and pattern.startswith(previous.pattern):
+            self._search = InFileSearch(self._code, pattern, mode, matcher, previous.offsets)
+        else:
+            self._search = InFileSearch(self._code, pattern, mode, matcher)
             
-        InFileSearchResult(results, self.hub)
+        if mode[2] and len(pattern) > 0:
+            if self._regexWorker == None:
+                self._regexWorker = RegexSearchWorker(self, self.hub)
+            self._regexWorker.search(
+                self._generation,
+                self._code.revision,
+                self._code.text,
+                matcher.pattern,
+                matcher.flags
+            )
+        else:
+            self._continueSearch()
+        
+    def _continueSearch(self):
+        search = self._search
+        deadline = time.perf_counter() + self._sliceSeconds
+        if self._result == None:
+            occurences = search.continueUntil(deadline, FIRST_RESULTS)
+            self._result = InFileSearchResult(occurences, self.hub)
+        else:
+            self._result.extend(search.continueUntil(deadline, None))
+        self._results = self._result.occurences
+        if not search.isDone():
+            self._timer.start(0)
+            
+    def _onRegexFound(self, generation, offsets, lengths, complete):
+        if generation != self._generation:
+            return
+        self._search.setMatches(offsets, lengths)
+        if not complete:
+            self._setError("Only the first %d matches are shown" % len(offsets))
+        self._continueSearch()
+        
+    def _onRegexFailed(self, generation, message):
+        if generation != self._generation:
+            return
+        self._setError(message)
+        InFileSearchResult([], self.hub)
+        
+    def _setError(self, message):
+        # Shown on the search-field, None removes it
+        if message == None:
+            self.lineEdit.setStyleSheet("")
+            self.lineEdit.setToolTip("")
+        else:
+            self.lineEdit.setStyleSheet("background-color: #ffd0d0")
+            self.lineEdit.setToolTip(message)
              
+def matcherFor(pattern, caseSensitive, wholeWords, regex): # re.Pattern|None
+    # None if the pattern is searched for as it is (see InFileSearch). Raises re.error for
+    # invalid regular expressions.
+    if caseSensitive and not wholeWords and not regex:
+        return None
+    if not regex:
+        pattern = re.escape(pattern)
+    if wholeWords:
+        pattern = "(?<![%s])(?:%s)(?![%s])" % (WORD_CHARACTERS, pattern, WORD_CHARACTERS)
+    return re.compile(pattern, 0 if caseSensitive else re.IGNORECASE)
+             
+class InFileSearchCode:
+    # The code of a document as of one revision, with the offsets at which its lines start
+    
+    def __init__(self, text: str, revision: int):
+        self.text = text
+        self.revision = revision
+        self._lineStarts = None # list<int>, created on first use
+        
+    def lineAndColumn(self, offset: int) -> tuple:
+        # return: (line, column), line starting at 1 and column at 0
+        if self._lineStarts == None:
+            text = self.text
+            lineStarts = [0]
+            position = text.find("\n")
+            while position >= 0:
+                lineStarts.append(position + 1)
+                position = text.find("\n", position + 1)
+            self._lineStarts = lineStarts
+        line = bisect.bisect_right(self._lineStarts, offset)
+        return (line, offset - self._lineStarts[line - 1])
+        
+class InFileSearch:
+    # The occurences of a pattern in code, found step by step (see continueUntil). Without a
+    # matcher the pattern is searched for as it is and occurences may overlap, with a matcher
+    # they are those that matcher.finditer finds. With candidates (the offsets of the occurences
+    # of a prefix of the pattern) only those offsets are checked instead of the whole code.
+    # Regular expressions are not searched for here, their matches are given (see setMatches).
+    
+    def __init__(
+        self,
+        code: InFileSearchCode,
+        pattern: str,
+        mode: tuple,
+        matcher: re.Pattern|None = None,
+        candidates: list[int]|None = None
+    ):
+        self.code = code
+        self.pattern = pattern
+        self.mode = mode # (caseSensitive, wholeWords, regex)
+        self.matcher = matcher
+        self.offsets = [] # of all occurences found so far
+        self._candidates = candidates
+        self._lengths = None # of the given matches, see setMatches
+        self._matches = None # iterator<re.Match> while searching with the matcher
+        self._position = 0 # in the code, or in candidates; None once the search is done
+        if len(pattern) <= 0:
+            self._position = None
+        
+    def isDone(self) -> bool:
+        return self._position == None
+        
+    def setMatches(self, offsets: list[int], lengths: list[int]) -> None:
+        self._candidates = offsets
+        self._lengths = lengths
+        
+    def continueUntil(self, deadline: float, limit: int|None) -> list:
+        # return: list<InFileSearchOccurence> found until the deadline (perf_counter) has passed,
+        # the search is done or (if not None) limit occurences were found
+        occurences = []
+        if self._position == None or (self.mode[2] and self._lengths == None):
+            return occurences
+        (code, text, pattern, matcher) = (self.code, self.code.text, self.pattern, self.matcher)
+        (candidates, lengths) = (self._candidates, self._lengths)
+        if candidates == None and matcher != None and self._matches == None:
+            self._matches = matcher.finditer(text)
+        position = self._position
+        while limit == None or len(occurences) < limit:
+            if candidates != None:
+                if position >= len(candidates):
+                    position = None
+                    break
+                offset = candidates[position]
+                position += 1
+                if lengths != None:
+                    length = lengths[position - 1]
+                elif matcher == None:
+                    if not text.startswith(pattern, offset):
+                        continue
+                    length = len(pattern)
+                else:
+                    match = matcher.match(text, offset)
+                    if match == None:
+                        continue
+                    length = match.end() - offset
+            elif matcher == None:
+                offset = text.find(pattern, position)
+                if offset < 0:
+                    position = None
+                    break
+                position = offset + 1
+                length = len(pattern)
+            else:
+                match = next(self._matches, None)
+                if match == None:
+                    position = None
+                    break
+                (offset, end) = match.span()
+                length = end - offset
+            self.offsets.append(offset)
+            (line, column) = code.lineAndColumn(offset)
+            occurences.append(InFileSearchOccurence(offset, line, column, pattern, text[offset:offset + length]))
+            if len(occurences) % 64 == 0 and time.perf_counter() > deadline:
+                break
+        self._position = position
+        return occurences
+        
 class InFileSearchResult:
     def __init__(self, occurences, hub: Hub):
         self.hub = hub
@@ -63,6 +289,15 @@ class InFileSearchResult:
         if not self.empty():
             self.hub.register(self.current())
         
+    def extend(self, occurences):
+        # More occurences of the same search (see SearchBar), the current one stays current
+        if len(occurences) > 0:
+            wasEmpty = self.empty()
+            self.occurences.extend(occurences)
+            self.hub.register(self)
+            if wasEmpty:
+                self.hub.register(self.current())
+        
     def empty(self):
         return len(self.occurences) <= 0
         
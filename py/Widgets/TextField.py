@@ -4,7 +4,7 @@ from PySide6.QtCore import QTimer
 
 from py.Autocomplete.AutocompleteItemModel import AutocompleteItemModel
 from py.Hub import Hub, Log, on
-from py.Api import TextField as TextFieldApi
+from py.Api import TextField as TextFieldApi, FileAccess
 from py.Widgets.SearchBar import InFileSearchOccurence
 
 class TextField(QtWidgets.QPlainTextEdit, TextFieldApi):
@@ -19,7 +19,6 @@ class TextField(QtWidgets.QPlainTextEdit, TextFieldApi):
         self.parent = parent
         self._selectionChangeCounter = 0
         self._textChangeCounter = 0
-        self._fileContent = ""
         
         self.setLineWrapMode(QtWidgets.QPlainTextEdit.NoWrap)
         
@@ -27,12 +26,11 @@ class TextField(QtWidgets.QPlainTextEdit, TextFieldApi):
 #        document.setPlainText("\n")
         
         self.updateRequest.connect(self.onUpdateRequest)
-        self.textChanged.connect(self.onTextChanged)
         self.selectionChanged.connect(self.onSelectionChanged)
         self.cursorPositionChanged.connect(self.onCursorPositionChanged)
         
         document.contentsChange.connect(self.onContentChange)
-        QTimer.singleShot(10, lambda: self._onFileContentChanged(force=True))
+        QTimer.singleShot(10, self._onFileContentChanged)
         
     def insertTextAt(self, position, text):
         cursor = QtGui.QTextCursor(self.document())
@@ -166,20 +164,13 @@ class TextField(QtWidgets.QPlainTextEdit, TextFieldApi):
     def onCursorPositionChanged(self):
         self.hub.notify(TextFieldApi.onCursorPositionChanged)
     
+    @on(FileAccess.onFileContentChanged)
     def onTextChanged(self):
-        self._onFileContentChanged(force = False)
+        self._onFileContentChanged()
 
-    def _onFileContentChanged(self, force: bool = False) -> None:
-        doc = self.document()
-        fileContent = doc.toPlainText()
-        
-        if fileContent == self._fileContent and not force:
-            return
-        
+    def _onFileContentChanged(self) -> None:
+        # The content was already compared with the previous snapshot (see ReparseScheduler)
         self._textChangeCounter += 1
-        
-        self._fileContent = fileContent
-        # self.window.onTextChanged()
 
         currentTextChangeCounter = self._textChangeCounter
         
@@ -0,0 +1,4 @@
+class Greeter(Parent):
+    def greet(self, name):
+        print(name)
+        raise ValueError(name)
@@ -52,6 +52,17 @@ class BackDoor(QtCore.QObject):
     def isSearchBarOpen(self) -> bool:
         return self.hub.get(SearchBar).isVisible()
         
+    @Slot(str, bool)
+    def searchFor(self, pattern, caseSensitive) -> None:
+        searchBar = self.hub.get(SearchBar)
+        searchBar.caseSensitiveButton.setChecked(caseSensitive)
+        searchBar.lineEdit.setText(pattern)
+        
+    @Slot(result=str)
+    def getSearchOffsets(self) -> str:
+        # Of the occurences found so far, separated by ", "
+        return ", ".join([str(occurence.offset) for occurence in self.hub.get(SearchBar).searchOccurences()])
+        
     @Slot(str)
     def writeText(self, text) -> None:
         document = self.hub.get(QtGui.QTextDocument)
@@ -61,4 +72,25 @@ class BackDoor(QtCore.QObject):
     @Slot(result=str)
     def getText(self) -> bool:
         return self.hub.get(QtGui.QTextDocument).toPlainText()
-        
\ No newline at end of file
+        
+    @Slot(int, int, result=str)
+    def getForegroundAt(self, line, column) -> str:
+        # Empty if the text has no color of its own
+        format = self._formatAt(line, column)
+        if format == None or not format.hasProperty(QtGui.QTextFormat.ForegroundBrush):
+            return ""
+        return format.foreground().color().name()
+        
+    @Slot(int, int, result=int)
+    def getFontWeightAt(self, line, column) -> int:
+        format = self._formatAt(line, column)
+        return format.fontWeight() if format != None else 0
+        
+    def _formatAt(self, line, column) -> QtGui.QTextCharFormat|None:
+        # As highlighted, line starting at 1 and column at 0
+        document = self.hub.get(QtGui.QTextDocument)
+        block = document.findBlockByLineNumber(line - 1)
+        for formatRange in block.layout().formats():
+            if formatRange.start <= column < formatRange.start + formatRange.length:
+                return QtGui.QTextCharFormat(formatRange.format)
+        return None
@@ -35,6 +35,13 @@ class EinsichtRobotLibrary:
         while not self._callBool('isReadyForInteraction'):
             time.sleep(0.01)
         
+    def open_the_fixture(self, fileName):
+        testBaseDir = dirname(dirname(abspath(__file__)))
+        self._start1SProcess([testBaseDir + "/fixtures/" + fileName])
+        self.interface = self._connectToBackdoor()
+        while not self._callBool('isReadyForInteraction'):
+            time.sleep(0.01)
+        
     def close_the_file(self):
         self.interface.call('exit')
         self._subprocess.terminate()
@@ -63,6 +70,16 @@ class EinsichtRobotLibrary:
     def ensure_search_bar_is_open(self):
         assert self._callBool('isSearchBarOpen') == True, "Search bar is closed, should be open!"
     
+    def search_for(self, pattern) -> None:
+        self.interface.call("searchFor", pattern, True)
+        
+    def search_case_insensitively_for(self, pattern) -> None:
+        self.interface.call("searchFor", pattern, False)
+        
+    def ensure_search_found(self, offsets) -> None:
+        actualOffsets = self._callStr('getSearchOffsets')
+        assert actualOffsets == offsets, "Search found '" + actualOffsets + "', should have found '" + offsets + "'!"
+        
     def write_text(self, text) -> None:
         self.interface.call("writeText", text)
         
@@ -72,6 +89,18 @@ class EinsichtRobotLibrary:
     def ensure_text_contains(self, needle) -> None:
         assert needle in self._callStr('getText'), "Text does not contain '" + needle + "' but it should!"
         
+    def ensure_color_at(self, line, column, color) -> None:
+        actualColor = self.interface.call('getForegroundAt', int(line), int(column)).arguments()[0]
+        assert actualColor == color, "Text at %s:%s is colored %s, should be %s!" % (line, column, actualColor, color)
+        
+    def ensure_no_color_at(self, line, column) -> None:
+        actualColor = self.interface.call('getForegroundAt', int(line), int(column)).arguments()[0]
+        assert actualColor == "", "Text at %s:%s is colored %s, should not be!" % (line, column, actualColor)
+        
+    def ensure_bold_at(self, line, column) -> None:
+        weight = self.interface.call('getFontWeightAt', int(line), int(column)).arguments()[0]
+        assert weight >= QtGui.QFont.Bold, "Text at %s:%s is not bold, should be!" % (line, column)
+        
     ### Private
         
     def _start1SProcess(self, args: list) -> subprocess.Popen:
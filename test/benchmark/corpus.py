@@ -0,0 +1,303 @@
+import sys, random
+
+# Generates source code that looks like real code, for benchmarks: modules of classes and
+# functions whose bodies nest blocks (if, for, while, try, ...) up to a given depth and whose
+# expressions mix names, calls and literals. The same arguments always generate the same code.
+#
+#  - lines: roughly how many lines to generate
+#  - depth: how deep blocks get nested inside of functions (or lists inside of lists)
+#  - literals: share (0.0 - 1.0) of the operands in expressions that are literals
+#  - comments: share (0.0 - 1.0) of the statements that follow comment lines (not for markdown)
+#
+# USAGE: corpus.py python|java|markdown [LINES [DEPTH [LITERALS [SEED [COMMENTS]]]]]
+
+NAMES = [
+    "value", "result", "index", "count", "name", "items", "node", "offset", "length", "line",
+    "parent", "children", "token", "buffer", "config", "handler", "request", "response"
+]
+WORDS = [
+    "the", "parser", "returns", "a", "tree", "of", "nodes", "for", "each", "statement", "in",
+    "code", "which", "is", "then", "used", "by", "highlighter", "and", "index", "to", "find"
+]
+
+class SourceWriter:
+    def __init__(self, indentation):
+        self._indentation = indentation
+        self._lines = []
+        self.level = 0
+
+    def line(self, text=""):
+        if len(text) > 0:
+            text = self._indentation * self.level + text
+        self._lines.append(text)
+
+    def lineCount(self): # int
+        return len(self._lines)
+
+    def code(self): # string
+        return "\n".join(self._lines) + "\n"
+
+class Generator:
+    def __init__(self, depth, literals, seed, comments):
+        self.depth = depth
+        self.literals = literals
+        self.comments = comments
+        self.random = random.Random(seed)
+
+    def name(self): # string
+        return self.random.choice(NAMES)
+
+    def className(self): # string
+        return self.name().capitalize() + self.random.choice(["Index", "Reader", "Node", "Cache"])
+
+    def words(self, minimum, maximum): # string
+        return " ".join(self.random.choice(WORDS) for count in range(self.random.randint(minimum, maximum)))
+
+    def literal(self): # string
+        kind = self.random.randrange(4)
+        if kind == 0:
+            return str(self.random.randrange(1000))
+        if kind == 1:
+            return "%d.%d" % (self.random.randrange(100), self.random.randrange(100))
+        return '"' + self.words(1, 4) + '"'
+
+    def operand(self): # string
+        if self.random.random() < self.literals:
+            return self.literal()
+        kind = self.random.randrange(3)
+        if kind == 0:
+            return self.name()
+        if kind == 1:
+            return self.name() + "." + self.name()
+        return self.call()
+
+    def call(self): # string
+        arguments = []
+        for count in range(self.random.randrange(3)):
+            if self.random.random() < self.literals:
+                arguments.append(self.literal())
+            else:
+                arguments.append(self.name())
+        return self.name() + "(" + ", ".join(arguments) + ")"
+
+    def hasComment(self): # boolean
+        # Without comments no random numbers are drawn, so that the rest of the code stays the same
+        return self.comments > 0 and self.random.random() < self.comments
+
+    def expression(self, operators): # string
+        expression = self.operand()
+        for count in range(self.random.randrange(3)):
+            expression += " " + self.random.choice(operators) + " " + self.operand()
+        return expression
+
+class PythonGenerator(Generator):
+    OPERATORS = ["+", "-", "*", "==", "!=", "<", "and", "or"]
+
+    def generate(self, lines): # string
+        writer = SourceWriter("    ")
+        writer.line("import os, sys")
+        writer.line("from .Parent import Parent")
+        writer.line()
+        while writer.lineCount() < lines:
+            if self.random.random() < 0.7:
+                self.writeClass(writer)
+            else:
+                self.writeFunction(writer, [self.name(), self.name()])
+            writer.line()
+        return writer.code()
+
+    def writeClass(self, writer):
+        writer.line("class %s(Parent):" % self.className())
+        writer.level += 1
+        writer.line("# " + self.words(3, 10))
+        for count in range(self.random.randint(1, 4)):
+            writer.line()
+            self.writeFunction(writer, ["self", self.name()])
+        writer.level -= 1
+
+    def writeFunction(self, writer, arguments):
+        writer.line("def %s(%s):" % (self.name(), ", ".join(arguments)))
+        writer.level += 1
+        writer.line('"""' + self.words(4, 12) + '"""')
+        self.writeStatements(writer, self.depth)
+        writer.line("return " + self.expression(self.OPERATORS))
+        writer.level -= 1
+
+    def writeStatements(self, writer, depth):
+        for count in range(self.random.randint(1, 4)):
+            if self.hasComment():
+                writer.line()
+                for commentLine in range(self.random.randint(1, 3)):
+                    writer.line("# " + self.words(3, 10))
+            kind = self.random.randrange(8 if depth > 0 else 3)
+            if kind == 0:
+                writer.line(self.name() + " = " + self.expression(self.OPERATORS))
+            elif kind == 1:
+                writer.line(self.call())
+            elif kind == 2:
+                writer.line("self." + self.name() + " = [" + self.operand() + ", " + self.operand() + "]")
+            elif kind in (3, 4):
+                writer.line("if " + self.expression(self.OPERATORS) + ":")
+                self.writeBlock(writer, depth)
+                if self.random.random() < 0.5:
+                    writer.line("else:")
+                    self.writeBlock(writer, depth)
+            elif kind == 5:
+                writer.line("for " + self.name() + " in " + self.operand() + ":")
+                self.writeBlock(writer, depth)
+            elif kind == 6:
+                writer.line("while " + self.expression(self.OPERATORS) + ":")
+                self.writeBlock(writer, depth)
+            else:
+                writer.line("try:")
+                self.writeBlock(writer, depth)
+                writer.line("except ValueError:")
+                self.writeBlock(writer, depth)
+
+    def writeBlock(self, writer, depth):
+        writer.level += 1
+        self.writeStatements(writer, depth - 1)
+        writer.level -= 1
+
+class JavaGenerator(Generator):
+    OPERATORS = ["+", "-", "*", "==", "!=", "<", "&&", "||"]
+    TYPES = ["int", "String", "double", "boolean", "List<String>"]
+
+    def generate(self, lines): # string
+        writer = SourceWriter("    ")
+        writer.line("package org.example.benchmark;")
+        writer.line()
+        writer.line("import java.util.List;")
+        writer.line("import java.util.ArrayList;")
+        writer.line()
+        while writer.lineCount() < lines:
+            self.writeClass(writer)
+            writer.line()
+        return writer.code()
+
+    def writeClass(self, writer):
+        writer.line("/* " + self.words(3, 10) + " */")
+        writer.line("public class %s extends Parent {" % self.className())
+        writer.level += 1
+        for count in range(self.random.randint(1, 3)):
+            writer.line("private %s %s = %s;" % (self.random.choice(self.TYPES), self.name(), self.operand()))
+        for count in range(self.random.randint(1, 4)):
+            writer.line()
+            writer.line("public %s %s(%s %s) {" % (
+                self.random.choice(self.TYPES),
+                self.name(),
+                self.random.choice(self.TYPES),
+                self.name()
+            ))
+            self.writeBlock(writer, self.depth)
+            writer.line("}")
+        writer.level -= 1
+        writer.line("}")
+
+    def writeStatements(self, writer, depth):
+        for count in range(self.random.randint(1, 4)):
+            if self.hasComment():
+                writer.line("/**")
+                for commentLine in range(self.random.randint(1, 3)):
+                    writer.line(" * " + self.words(3, 10))
+                writer.line(" */")
+            kind = self.random.randrange(7 if depth > 0 else 3)
+            if kind == 0:
+                writer.line("%s %s = %s;" % (
+                    self.random.choice(self.TYPES),
+                    self.name(),
+                    self.expression(self.OPERATORS)
+                ))
+            elif kind == 1:
+                writer.line(self.call() + ";")
+            elif kind == 2:
+                writer.line("// " + self.words(3, 8))
+            elif kind in (3, 4):
+                writer.line("if (" + self.expression(self.OPERATORS) + ") {")
+                self.writeBlock(writer, depth)
+                if self.random.random() < 0.5:
+                    writer.line("} else {")
+                    self.writeBlock(writer, depth)
+                writer.line("}")
+            elif kind == 5:
+                writer.line("for (int %s = 0; %s < %s; %s++) {" % (("i",) * 2 + (self.operand(), "i")))
+                self.writeBlock(writer, depth)
+                writer.line("}")
+            else:
+                writer.line("try {")
+                self.writeBlock(writer, depth)
+                writer.line("} catch (Exception exception) {")
+                self.writeBlock(writer, depth)
+                writer.line("}")
+        writer.line("return " + self.expression(self.OPERATORS) + ";")
+
+    def writeBlock(self, writer, depth):
+        writer.level += 1
+        self.writeStatements(writer, depth - 1)
+        writer.level -= 1
+
+class MarkdownGenerator(Generator):
+    def generate(self, lines): # string
+        writer = SourceWriter("  ")
+        while writer.lineCount() < lines:
+            writer.line("#" * self.random.randint(1, 3) + " " + self.words(2, 5).capitalize())
+            writer.line()
+            for count in range(self.random.randint(1, 3)):
+                writer.line(self.paragraph())
+                writer.line()
+            kind = self.random.randrange(3)
+            if kind == 0:
+                self.writeList(writer, self.depth)
+                writer.line()
+            elif kind == 1:
+                writer.line("```python")
+                writer.line(self.name() + " = " + self.call())
+                writer.line("```")
+                writer.line()
+        return writer.code()
+
+    def paragraph(self): # string
+        parts = []
+        for count in range(self.random.randint(4, 12)):
+            if self.random.random() < self.literals:
+                kind = self.random.randrange(3)
+                if kind == 0:
+                    parts.append("`" + self.call() + "`")
+                elif kind == 1:
+                    parts.append("[" + self.words(1, 3) + "](https://example.org/" + self.name() + ")")
+                else:
+                    parts.append("**" + self.words(1, 2) + "**")
+            else:
+                parts.append(self.words(1, 3))
+        return " ".join(parts) + "."
+
+    def writeList(self, writer, depth):
+        for count in range(self.random.randint(2, 4)):
+            writer.line("- " + self.words(2, 6))
+            if depth > 1 and self.random.random() < 0.3:
+                writer.level += 1
+                self.writeList(writer, depth - 1)
+                writer.level -= 1
+
+GENERATORS = {
+    "python": PythonGenerator,
+    "java": JavaGenerator,
+    "markdown": MarkdownGenerator,
+}
+
+def generateSource(language, lines, depth=3, literals=0.3, seed=1, comments=0.0): # string
+    return GENERATORS[language](depth, literals, seed, comments).generate(lines)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in GENERATORS:
+        print("USAGE: corpus.py " + "|".join(GENERATORS) + " [LINES [DEPTH [LITERALS [SEED [COMMENTS]]]]]")
+        sys.exit(1)
+    arguments = sys.argv[2:]
+    print(generateSource(
+        sys.argv[1],
+        int(arguments[0]) if len(arguments) > 0 else 1000,
+        int(arguments[1]) if len(arguments) > 1 else 3,
+        float(arguments[2]) if len(arguments) > 2 else 0.3,
+        int(arguments[3]) if len(arguments) > 3 else 1,
+        float(arguments[4]) if len(arguments) > 4 else 0.0
+    ), end="")
@@ -0,0 +1,78 @@
+import sys, time, gc
+from os.path import dirname, abspath
+
+sys.path.append(dirname(dirname(dirname(abspath(__file__)))))
+
+from py.Hub import Hub, Log
+from py.Languages.PythonLanguage import PythonLanguage
+
+# Lexes generated python code of growing size and prints the time per line.
+# With a linear lexer the time per line stays (roughly) the same for all sizes. The lexer returns
+# a TokenStream that keeps the tokens column-wise in arrays, so the time is that of matching only.
+# The last column shows the time to re-lex after typing one character in the middle of the code.
+#
+# USAGE: lexing.py [LINES ...]
+
+SAMPLE = """
+import os
+from .Parent import Parent
+
+class SomeClass(Parent):
+    # Some comment about this class
+    def __init__(self, name, values=[]):
+        self.name = name
+        self.values = [1, 2.5, 'three', "four"]
+
+    def process(self, factor):
+        if factor > 0 and not self.values == None:
+            return self.compute(factor * 2, self.name + "-suffix")
+        raise ValueError("invalid factor")
+"""
+
+def generateCode(lines):
+    sampleLines = SAMPLE.count("\n")
+    return SAMPLE * max(1, lines // sampleLines)
+
+if __name__ == "__main__":
+    Log.debug = lambda message: None
+    
+    sizes = [1000, 2000, 5000, 10000, 20000]
+    if len(sys.argv) > 1:
+        sizes = list(map(int, sys.argv[1:]))
+    
+    print(
+        "lines".rjust(8), 
+        "tokens".rjust(9), 
+        "seconds".rjust(9), 
+        "us/line".rjust(9), 
+        "keystroke ms".rjust(13)
+    )
+    
+    usPerLine = []
+    for size in sizes:
+        code = generateCode(size)
+        language = PythonLanguage(Hub())
+        gc.collect()
+        
+        start = time.perf_counter()
+        tokens = language.lex(code, None)
+        duration = time.perf_counter() - start
+        
+        position = code.find("factor * 2", len(code) // 2)
+        changedCode = code[:position] + "x" + code[position:]
+        
+        start = time.perf_counter()
+        language.lex(changedCode, tokens, (position, 0, 1))
+        keystrokeDuration = time.perf_counter() - start
+        
+        lines = code.count("\n")
+        usPerLine.append(duration * 1000000 / lines)
+        print(
+            str(lines).rjust(8), 
+            str(len(tokens)).rjust(9), 
+            ("%.3f" % duration).rjust(9), 
+            ("%.2f" % usPerLine[-1]).rjust(9),
+            ("%.2f" % (keystrokeDuration * 1000)).rjust(13)
+        )
+        
+    print("\nus/line of biggest vs. smallest input: %.2fx" % (usPerLine[-1] / usPerLine[0]))
@@ -0,0 +1,97 @@
+import sys, gc, tracemalloc
+from os import listdir
+from os.path import dirname, abspath, join, isfile
+
+ROOT = dirname(dirname(dirname(abspath(__file__))))
+
+sys.path.append(ROOT)
+
+from py.Hub import Hub, Log
+from py.Languages.LanguageSelector import LanguageSelector
+
+# Parses files and prints how much memory the resulting tokens and syntax-tree keep alive,
+# in bytes per kilobyte of source code. Without arguments, the test fixtures are used.
+#
+# USAGE: memory.py [FILE ...]
+
+FIXTURES = join(ROOT, "test", "behaviour", "fixtures")
+
+def countNodes(nodes): # int
+    count = 0
+    for node in nodes:
+        count += 1
+        count += countNodes(node.prepended)
+        count += countNodes(node.children)
+        count += countNodes(node.appended)
+    return count
+
+if __name__ == "__main__":
+    Log.debug = lambda message: None
+
+    filePaths = sys.argv[1:]
+    if len(filePaths) <= 0:
+        for fileName in sorted(listdir(FIXTURES)):
+            if isfile(join(FIXTURES, fileName)):
+                filePaths.append(join(FIXTURES, fileName))
+
+    print(
+        "file".ljust(24),
+        "bytes".rjust(8),
+        "nodes".rjust(7),
+        "lexed B/KB".rjust(11),
+        "parsed B/KB".rjust(12)
+    )
+
+    totalSource = 0
+    totalLexed = 0
+    totalParsed = 0
+    hub = Hub()
+    selector = LanguageSelector(hub)
+    for filePath in filePaths:
+        with open(filePath, "r") as handle:
+            code = handle.read()
+        if len(code) <= 0:
+            continue
+
+        # Measures the lexer alone and then the full parse with a fresh language each, so that
+        # no cache is shared between both measurements. Compiling the lexer is not measured.
+        language = selector.selectForFilePath(filePath)
+        language.lexer()
+        gc.collect()
+        tracemalloc.start()
+        tokens = language.lex(code, None)
+        gc.collect()
+        lexed = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del tokens, language
+
+        language = selector.selectForFilePath(filePath)
+        language.lexer()
+        gc.collect()
+        tracemalloc.start()
+        (ast, tokens) = language.parse(code, filePath)
+        gc.collect()
+        parsed = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        nodes = 0
+        if ast != None:
+            nodes = countNodes([ast])
+
+        kiloBytes = len(code.encode()) / 1024
+        totalSource += kiloBytes
+        totalLexed += lexed
+        totalParsed += parsed
+        print(
+            filePath.split("/")[-1][:24].ljust(24),
+            str(len(code.encode())).rjust(8),
+            str(nodes).rjust(7),
+            str(int(lexed / kiloBytes)).rjust(11),
+            str(int(parsed / kiloBytes)).rjust(12)
+        )
+        del ast, tokens, language
+
+    if totalSource > 0:
+        print(
+            "\ntotal: %d B/KB lexed, %d B/KB parsed" % (totalLexed / totalSource, totalParsed / totalSource)
+        )
@@ -0,0 +1,66 @@
+import sys, time, gc
+from os.path import dirname, abspath
+
+sys.path.append(dirname(dirname(dirname(abspath(__file__)))))
+
+from py.Hub import Hub, Log
+from py.Languages.AbstractSyntaxTree import SourceBuffer
+from py.Languages.PythonLanguage import PythonLanguage
+from py.Languages.JavaLanguage import JavaLanguage
+from corpus import generateSource
+
+# Normalizes comment-heavy generated code (see corpus.py) of growing size and prints the time
+# per line. Normalizing attaches whitespace and comments to the relevant tokens, which should
+# take the same time per line for all sizes.
+#
+# USAGE: normalize.py [LINES ...]
+
+LANGUAGES = [
+    ("python", PythonLanguage),
+    ("java", JavaLanguage),
+]
+
+COMMENTS = 0.8
+
+if __name__ == "__main__":
+    Log.debug = lambda message: None
+
+    sizes = [1000, 5000, 20000, 50000]
+    if len(sys.argv) > 1:
+        sizes = list(map(int, sys.argv[1:]))
+
+    print(
+        "language".ljust(8),
+        "lines".rjust(8),
+        "tokens".rjust(9),
+        "relevant".rjust(9),
+        "ms".rjust(9),
+        "us/line".rjust(9)
+    )
+
+    for (languageName, languageClass) in LANGUAGES:
+        usPerLine = []
+        for size in sizes:
+            code = generateSource(languageName, size, comments=COMMENTS)
+            language = languageClass(Hub())
+            stream = language.lex(code, None)
+            tokens = stream.tokens(0, len(stream), SourceBuffer(stream.code))
+            tokenCount = len(tokens)
+            gc.collect()
+
+            start = time.perf_counter()
+            relevantTokens = language.normalize(tokens)
+            duration = time.perf_counter() - start
+
+            lines = code.count("\n")
+            usPerLine.append(duration * 1000000 / lines)
+            print(
+                languageName.ljust(8),
+                str(lines).rjust(8),
+                str(tokenCount).rjust(9),
+                str(len(relevantTokens)).rjust(9),
+                ("%.2f" % (duration * 1000)).rjust(9),
+                ("%.2f" % usPerLine[-1]).rjust(9)
+            )
+
+        print("us/line of biggest vs. smallest input: %.2fx\n" % (usPerLine[-1] / usPerLine[0]))
@@ -0,0 +1,59 @@
+import sys, time, gc
+from os.path import dirname, abspath
+
+sys.path.append(dirname(dirname(dirname(abspath(__file__)))))
+
+from py.Hub import Hub, Log
+from py.Languages.PythonLanguage import PythonLanguage
+from lexing import generateCode
+
+# Parses generated python code of growing size and prints the time per line.
+# Applying the grammar should take (roughly) the same time per line for all sizes.
+# The last column shows the time to parse again after typing one character in the middle of the
+# code, which only re-parses the statements around the change.
+#
+# USAGE: parsing.py [LINES ...]
+
+if __name__ == "__main__":
+    Log.debug = lambda message: None
+    
+    sizes = [1000, 2000, 5000, 10000, 20000, 50000]
+    if len(sys.argv) > 1:
+        sizes = list(map(int, sys.argv[1:]))
+    
+    print(
+        "lines".rjust(8), 
+        "tokens".rjust(9), 
+        "seconds".rjust(9), 
+        "us/line".rjust(9), 
+        "keystroke ms".rjust(13)
+    )
+    
+    usPerLine = []
+    for size in sizes:
+        code = generateCode(size)
+        language = PythonLanguage(Hub())
+        gc.collect()
+        
+        start = time.perf_counter()
+        (ast, tokens) = language.parse(code, "benchmark.py")
+        duration = time.perf_counter() - start
+        
+        position = code.find("factor * 2", len(code) // 2)
+        changedCode = code[:position] + "x" + code[position:]
+        
+        start = time.perf_counter()
+        language.parse(changedCode, "benchmark.py", ast, tokens, (position, 0, 1))
+        keystrokeDuration = time.perf_counter() - start
+        
+        lines = code.count("\n")
+        usPerLine.append(duration * 1000000 / lines)
+        print(
+            str(lines).rjust(8), 
+            str(len(tokens)).rjust(9), 
+            ("%.3f" % duration).rjust(9), 
+            ("%.2f" % usPerLine[-1]).rjust(9),
+            ("%.2f" % (keystrokeDuration * 1000)).rjust(13)
+        )
+        
+    print("\nus/line of biggest vs. smallest input: %.2fx" % (usPerLine[-1] / usPerLine[0]))
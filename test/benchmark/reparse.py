@@ -0,0 +1,111 @@
+import sys, random
+from os.path import dirname, abspath
+from glob import glob
+
+ROOT = dirname(dirname(dirname(abspath(__file__))))
+sys.path.append(ROOT)
+
+from py.Hub import Hub, Log
+from py.Languages.Tokens import Token
+from py.Languages.PythonLanguage import PythonLanguage
+from corpus import generateSource
+
+# Makes random edits to python code (generated, see corpus.py, and the sources of this project)
+# and compares the syntax-tree of each incremental parse with that of parsing the edited code as
+# a whole. Both must be equal in every node, position and code. Prints how many edits could be
+# parsed incrementally; the exit-code is non-zero if any syntax-tree differs.
+#
+# USAGE: reparse.py [EDITS [SEED]]
+
+TEXTS = ["x", "e", "_", "1", "0.5", " ", "\n", "\n    ", "(", ")", "=", ":", ",", ".", "'", "#", "list"]
+
+# Edits that once produced a different syntax-tree: (code, position, removed, text)
+REGRESSIONS = [
+    (
+        "class SearchBar:\n    def onTextChanged(self):\n"
+        "        text = document.toPlainText()\n        offset = 0\n        line = 1\n",
+        77, 0, "x"
+    ),
+    (
+        "def run():\n    if ready:\n        value = 1\n    return value\n",
+        32, 5, " "
+    ),
+]
+
+def dumpNodes(node, lines, depth=0): # list<string>
+    if isinstance(node, Token):
+        description = node.tokenName
+    else:
+        description = node.type
+    lines.append("%s%s %d:%d@%d %r" % ("  " * depth, description, node.row, node.col, node.offset, node.code))
+    for prepended in node.prepended:
+        dumpNodes(prepended, lines, depth + 1)
+    for child in node.children:
+        dumpNodes(child, lines, depth + 1)
+    for appended in node.appended:
+        dumpNodes(appended, lines, depth + 1)
+    return lines
+
+def compare(language, code, ast, tokens, position, removed, text): # (string, ASTRoot, list, boolean, boolean)
+    # The edited code, its incremental syntax-tree and tokens, whether it was parsed incrementally
+    # and whether it equals the syntax-tree of the code parsed as a whole
+    changedCode = code[:position] + text + code[position + removed:]
+    revision = ast.revision if ast != None else None
+    (changedAst, changedTokens) = language.parse(changedCode, "reparse.py", ast, tokens, (position, removed, len(text)))
+    incremental = changedAst is ast and ast != None and ast.revision != revision
+    (fullAst, fullTokens) = PythonLanguage(Hub()).parse(changedCode, "reparse.py")
+    (lines, fullLines) = ([], [])
+    if changedAst != None:
+        dumpNodes(changedAst, lines)
+    if fullAst != None:
+        dumpNodes(fullAst, fullLines)
+    return (changedCode, changedAst, changedTokens, incremental, lines == fullLines)
+
+if __name__ == "__main__":
+    Log.debug = lambda message: None
+
+    edits = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    random.seed(int(sys.argv[2]) if len(sys.argv) > 2 else 1)
+
+    sources = [generateSource("python", 300)]
+    for filePath in sorted(glob(ROOT + "/py/**/*.py", recursive=True)):
+        with open(filePath) as handle:
+            code = handle.read()
+        if 0 < len(code) < 20000:
+            sources.append(code)
+
+    (total, incrementally, mismatches) = (0, 0, 0)
+
+    for (code, position, removed, text) in REGRESSIONS:
+        language = PythonLanguage(Hub())
+        (ast, tokens) = language.parse(code, "reparse.py")
+        (changedCode, ast, tokens, incremental, equal) = compare(language, code, ast, tokens, position, removed, text)
+        total += 1
+        incrementally += 1 if incremental else 0
+        if not equal:
+            mismatches += 1
+            print("MISMATCH in regression, at %d: %r" % (position, text))
+
+    while total < edits:
+        code = random.choice(sources)
+        language = PythonLanguage(Hub())
+        (ast, tokens) = language.parse(code, "reparse.py")
+        for step in range(0, 10):
+            position = random.randint(0, len(code))
+            removed = min(random.choice([0, 0, 0, 1, 3]), len(code) - position)
+            text = random.choice(TEXTS) if removed <= 0 or random.random() < 0.5 else ""
+            (changedCode, ast, tokens, incremental, equal) = compare(
+                language, code, ast, tokens, position, removed, text
+            )
+            total += 1
+            incrementally += 1 if incremental else 0
+            if not equal:
+                mismatches += 1
+                print("MISMATCH at %d, removed %d: %r near %r" % (
+                    position, removed, text, code[max(0, position - 20):position + 20]
+                ))
+                break
+            code = changedCode
+
+    print("edits: %d, parsed incrementally: %d, different syntax-trees: %d" % (total, incrementally, mismatches))
+    sys.exit(1 if mismatches > 0 else 0)
@@ -0,0 +1,204 @@
+import sys, time, gc, json, platform, argparse
+from os.path import dirname, abspath
+
+sys.path.append(dirname(dirname(dirname(abspath(__file__)))))
+
+from py.Hub import Hub, Log
+from py.Languages.Language import FileContext
+from py.Languages.AbstractSyntaxTree import ASTRoot, SourceBuffer
+from py.Languages.PythonLanguage import PythonLanguage
+from py.Languages.JavaLanguage import JavaLanguage
+from py.Languages.MarkdownLanguage import MarkdownLanguage
+from corpus import generateSource
+
+# Times each step of parsing separately, on generated code (see corpus.py) of each language and
+# size: lexing, normalizing, applying the grammar, grouping statements into blocks and populating
+# the file-context. Runs without a Qt event loop. Each step is run --repeat times on a fresh
+# language and the fastest run counts.
+#
+# The results can be written to a JSON file (--output) and compared with those of an earlier run
+# (--baseline): steps that got slower than --tolerance allows are reported as regressions and
+# make the exit-code non-zero. Steps that take less than a millisecond are not compared, their
+# times are mostly noise. Baselines are only comparable on the same machine.
+#
+# USAGE: suite.py [--languages python,java,markdown] [--sizes 1000,5000] [--depth 3]
+#                 [--literals 0.3] [--comments 0.0] [--repeat 3] [--output FILE] [--baseline FILE]
+#                 [--tolerance 0.2]
+
+FORMAT_VERSION = 1
+
+LANGUAGES = {
+    "python": (PythonLanguage, "benchmark.py"),
+    "java": (JavaLanguage, "Benchmark.java"),
+    "markdown": (MarkdownLanguage, "benchmark.md"),
+}
+
+STEPS = ["lex", "tokens", "normalize", "applyGrammar", "groupStatementsIntoBlocks", "populateFileContext"]
+
+PROJECT_FOLDER = "/benchmark"
+
+def runOnce(languageClass, filePath, code): # dict(step => seconds), counts
+    language = languageClass(Hub())
+    language.lexer()
+    grammarMap = language.grammarMap()
+    seconds = {}
+    gc.collect()
+
+    started = time.perf_counter()
+    stream = language.lex(code, None)
+    seconds["lex"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    tokens = stream.tokens(0, len(stream), SourceBuffer(stream.code))
+    seconds["tokens"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    tokens = language.normalize(tokens)
+    seconds["normalize"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    nodes = language._applyGrammar(tokens.copy(), grammarMap)
+    seconds["applyGrammar"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    nodes = language.groupStatementsIntoBlocks(nodes)
+    seconds["groupStatementsIntoBlocks"] = time.perf_counter() - started
+
+    context = FileContext(PROJECT_FOLDER + "/" + filePath, PROJECT_FOLDER, ASTRoot(nodes, filePath), language)
+    started = time.perf_counter()
+    language.populateFileContext(context)
+    seconds["populateFileContext"] = time.perf_counter() - started
+
+    counts = {
+        "lexedTokens": len(stream),
+        "relevantTokens": len(tokens),
+        "statements": len(nodes),
+        "classes": len(context.classes()),
+        "functions": len(context.functions()),
+    }
+    return (seconds, counts)
+
+def runBenchmark(languageName, lines, depth, literals, comments, repeat): # dict
+    (languageClass, filePath) = LANGUAGES[languageName]
+    code = generateSource(languageName, lines, depth, literals, comments=comments)
+    best = None
+    for run in range(repeat):
+        (seconds, counts) = runOnce(languageClass, filePath, code)
+        if best == None:
+            best = seconds
+        else:
+            best = {step: min(best[step], seconds[step]) for step in STEPS}
+    return {
+        "language": languageName,
+        "lines": code.count("\n"),
+        "bytes": len(code),
+        "counts": counts,
+        "seconds": best,
+    }
+
+def benchmarkKey(result): # string
+    return "%s/%d" % (result["language"], result["lines"])
+
+def compare(results, baseline, tolerance): # list(string), regressions
+    baselineResults = {benchmarkKey(result): result for result in baseline["results"]}
+    regressions = []
+    print("\ncompared to baseline (ratio of times, >1 is slower):")
+    for result in results:
+        key = benchmarkKey(result)
+        if key not in baselineResults:
+            print(key.ljust(18), "not in baseline")
+            continue
+        ratios = []
+        for step in STEPS:
+            seconds = result["seconds"][step]
+            baselineSeconds = baselineResults[key]["seconds"].get(step)
+            if baselineSeconds == None or max(seconds, baselineSeconds) < 0.001:
+                ratios.append("-".rjust(8))
+                continue
+            ratio = seconds / max(baselineSeconds, 0.000001)
+            ratios.append(("%.2fx" % ratio).rjust(8))
+            if ratio > 1 + tolerance:
+                regressions.append("%s %s: %.1f ms -> %.1f ms (%.2fx)" % (
+                    key, step, baselineSeconds * 1000, seconds * 1000, ratio
+                ))
+        print(key.ljust(18), *ratios)
+    return regressions
+
+def printHeader():
+    print("benchmark".ljust(18), *[step[:8].rjust(8) for step in STEPS], "us/line".rjust(9))
+
+def printResult(result):
+    seconds = result["seconds"]
+    print(
+        benchmarkKey(result).ljust(18),
+        *[("%.1f" % (seconds[step] * 1000)).rjust(8) for step in STEPS],
+        ("%.2f" % (sum(seconds.values()) * 1000000 / result["lines"])).rjust(9)
+    )
+
+def numbers(text, type): # list
+    return [type(value) for value in text.split(",") if value != ""]
+
+if __name__ == "__main__":
+    Log.debug = lambda message: None
+
+    parser = argparse.ArgumentParser(description="Times lexing and parsing of generated code.")
+    parser.add_argument("--languages", default=",".join(LANGUAGES))
+    parser.add_argument("--sizes", default="1000,5000", help="lines of code per benchmark")
+    parser.add_argument("--depth", type=int, default=3, help="nesting depth of blocks")
+    parser.add_argument("--literals", type=float, default=0.3, help="share of literals in expressions")
+    parser.add_argument("--comments", type=float, default=0.0, help="share of statements after comments")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="JSON file to write the results to")
+    parser.add_argument("--baseline", help="JSON file of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%")
+    arguments = parser.parse_args()
+
+    languages = arguments.languages.split(",")
+    for languageName in languages:
+        if languageName not in LANGUAGES:
+            parser.error("unknown language " + languageName)
+
+    print("times in ms, fastest of %d runs\n" % arguments.repeat)
+    printHeader()
+    results = []
+    for languageName in languages:
+        for lines in numbers(arguments.sizes, int):
+            results.append(runBenchmark(
+                languageName,
+                lines,
+                arguments.depth,
+                arguments.literals,
+                arguments.comments,
+                arguments.repeat
+            ))
+            printResult(results[-1])
+
+    report = {
+        "format": FORMAT_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "settings": {
+            "depth": arguments.depth,
+            "literals": arguments.literals,
+            "comments": arguments.comments,
+            "repeat": arguments.repeat,
+        },
+        "results": results,
+    }
+
+    if arguments.output != None:
+        with open(arguments.output, "w") as handle:
+            json.dump(report, handle, indent=4)
+
+    if arguments.baseline != None:
+        with open(arguments.baseline) as handle:
+            baseline = json.load(handle)
+        if baseline.get("settings") != report["settings"]:
+            print("\nnote: baseline was run with other settings:", baseline.get("settings"))
+        regressions = compare(results, baseline, arguments.tolerance)
+        if len(regressions) > 0:
+            print("\nregressions (more than %d%% slower):" % (arguments.tolerance * 100))
+            for regression in regressions:
+                print("  " + regression)
+            sys.exit(1)